@@ -0,0 +1,125 @@
+# async_runtime.py
+# Runtime alternativo para os peers: um único event loop asyncio por processo dirige
+# heartbeats, consultas de membership, timers de SC e o envio das mensagens de
+# protocolo de todos os peers do processo. Sem ele, cada Peer tem thread de heartbeat,
+# thread de timers (mais uma thread curta por timer disparado) e executor próprio.
+# As chamadas Pyro continuam bloqueantes: vão para pools limitados e compartilhados.
+import asyncio
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def default_runtime():
+    """Runtime compartilhado do processo, criado no primeiro uso."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = AsyncRuntime()
+        return _shared
+
+
+class AsyncRuntime:
+    """
+    Event loop numa thread própria mais dois pools:
+      io    -- chamadas Pyro e mensagens de saída (Peer._executor de todos os peers)
+      tasks -- callbacks de timers e tarefas periódicas, que podem esperar por io
+    Separar os dois evita que callbacks esperando respostas ocupem todas as threads
+    das quais as respostas dependem.
+    """
+
+    def __init__(self, io_workers=32, task_workers=8):
+        self.loop = asyncio.new_event_loop()
+        self.io = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="runtime-io")
+        self.tasks = ThreadPoolExecutor(max_workers=task_workers, thread_name_prefix="runtime-task")
+        self._thread = threading.Thread(target=self.loop.run_forever, name="runtime-loop", daemon=True)
+        self._thread.start()
+
+    def executor(self):
+        return _PeerExecutor(self.io)
+
+    def timers(self):
+        return LoopTimers(self)
+
+    def every(self, interval, fn, first=0.0):
+        """
+        Roda fn() no pool de tarefas a cada `interval` s (contados do fim da rodada
+        anterior, como um laço com sleep), a primeira vez após `first` s.
+        Retorna um Future; cancel() encerra a repetição.
+        """
+        async def repeat():
+            await asyncio.sleep(first)
+            while True:
+                try:
+                    await self.loop.run_in_executor(self.tasks, fn)
+                except Exception as e:
+                    print(f"[runtime] falha em {getattr(fn, '__qualname__', fn)}: {e}")
+                await asyncio.sleep(interval)
+
+        return asyncio.run_coroutine_threadsafe(repeat(), self.loop)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.tasks.shutdown(wait=False)
+        self.io.shutdown(wait=False)
+
+
+class _PeerExecutor:
+    # visão de um peer sobre o pool io: shutdown() só vale para ele, o pool continua servindo os demais
+    def __init__(self, pool):
+        self._pool = pool
+        self._closed = False
+
+    def submit(self, fn, *args, **kwargs):
+        if self._closed:
+            raise RuntimeError("executor encerrado")
+        return self._pool.submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait=False):
+        self._closed = True
+
+
+class LoopTimers:
+    """
+    Mesma interface de peer._TimerQueue (schedule/cancel/remaining/stop), com os
+    prazos no event loop e os callbacks no pool de tarefas do runtime.
+    """
+
+    def __init__(self, runtime):
+        self._runtime = runtime
+        self._seq = itertools.count()
+        self._stopped = False
+
+    def remaining(self, entry):
+        return max(entry[0] - time.monotonic(), 0.0)
+
+    def schedule(self, delay, fn, *args):
+        entry = [time.monotonic() + delay, next(self._seq), fn, args]
+        self._runtime.loop.call_soon_threadsafe(self._arm, entry)
+        return entry
+
+    def _arm(self, entry):
+        # no loop; asyncio também mede o tempo com time.monotonic
+        if entry[2] is not None:
+            self._runtime.loop.call_at(entry[0], self._fire, entry)
+
+    def _fire(self, entry):
+        fn = entry[2]
+        if fn is None or self._stopped:
+            return
+        try:
+            self._runtime.tasks.submit(fn, *entry[3])
+        except RuntimeError:
+            # runtime encerrado
+            pass
+
+    def cancel(self, entry):
+        # cancelamento preguiçoso, como em _TimerQueue: o disparo é ignorado
+        entry[2] = None
+
+    def stop(self):
+        self._stopped = True
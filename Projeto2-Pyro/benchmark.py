@@ -0,0 +1,292 @@
+# benchmark.py
+# Sobe N peers locais (num processo só ou repartidos entre processos), roda uma carga
+# acquire/hold/release e imprime as métricas em JSON.
+# Uso: python benchmark.py [--algorithm ricart] [--peers 5] [--processes 1] [--cycles 20] [opções]
+#      python benchmark.py --help  # lista as opções
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import Pyro5.api
+import Pyro5.serializers
+import local_transport
+from async_runtime import AsyncRuntime
+from metrics import percentile
+from nameserver_helper import get_or_start_nameserver, group_tag, register_peer
+from peer import DEFAULT_RESOURCE, READ, WRITE
+from start_peer import ALGORITHMS
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(usage="python benchmark.py [opções]")
+    parser.add_argument("--algorithm", choices=sorted(ALGORITHMS), default="ricart")
+    parser.add_argument("--peers", type=int, default=5, help="número total de peers")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="processos entre os quais os peers são repartidos (1 = tudo neste processo)")
+    parser.add_argument("--cycles", type=int, default=20, help="pedidos de SC por peer")
+    parser.add_argument("--hold", type=float, default=0.01, help="tempo (s) dentro da SC")
+    parser.add_argument("--think", type=float, default=0.0,
+                        help="pausa média (s, exponencial) entre uma saída e o próximo pedido")
+    parser.add_argument("--resources", type=int, default=1,
+                        help="recursos distintos; cada pedido sorteia um (1 = recurso padrão)")
+    parser.add_argument("--read-ratio", type=float, default=0.0,
+                        help="fração dos pedidos em modo READ (só --algorithm ricart)")
+    parser.add_argument("--k", type=int, default=1, help="vagas com --algorithm kmutex")
+    parser.add_argument("--groups", type=int, default=1,
+                        help="grupos de peers (o peer Bi fica no grupo i %% G): com --algorithm hier cada grupo "
+                             "é um cluster e só os coordenadores falam entre grupos; nos demais todos competem "
+                             "juntos e os grupos só servem para contar as mensagens entre grupos")
+    parser.add_argument("--runtime", choices=("threads", "async"), default="threads",
+                        help="async: um event loop e pools compartilhados por processo em vez de threads por peer")
+    parser.add_argument("--colocate", action="store_true",
+                        help="um daemon por processo para todos os seus peers, que se chamam direto "
+                             "(local_transport) em vez de por TCP")
+    parser.add_argument("--serializer", choices=sorted(Pyro5.serializers.serializers), default=None,
+                        help="serializador das chamadas entre peers (padrão do Pyro: serpent)")
+    parser.add_argument("--net-delay", type=float, default=0.0,
+                        help="atraso injetado (s) em cada mensagem entre peers (ver fault_injection.py)")
+    parser.add_argument("--net-jitter", type=float, default=0.0, help="jitter injetado (s), uniforme")
+    parser.add_argument("--net-drop", type=float, default=0.0, help="probabilidade de perda injetada")
+    parser.add_argument("--ns-host", default="localhost")
+    parser.add_argument("--ns-port", type=int, default=9090)
+    parser.add_argument("--output", help="grava o JSON também neste arquivo")
+    args = parser.parse_args(argv)
+    if args.processes < 1 or args.peers < args.processes:
+        parser.error("--processes deve estar entre 1 e --peers")
+    if args.read_ratio > 0 and READ not in ALGORITHMS[args.algorithm].cs_modes:
+        parser.error(f"--algorithm {args.algorithm} não tem modo READ")
+    if args.k != 1 and args.algorithm != "kmutex":
+        parser.error("--k só vale com --algorithm kmutex")
+    if not 1 <= args.groups <= args.peers:
+        parser.error("--groups deve estar entre 1 e --peers")
+    return args
+
+
+def _peer_kwargs(config):
+    kwargs = {"ns_address": (config["ns_host"], config["ns_port"]), "verbose": False,
+              "serializer": config["serializer"]}
+    if config["algorithm"] == "kmutex":
+        kwargs["k"] = config["k"]
+    if config["algorithm"] == "hier":
+        kwargs["global_group"] = f"{config['bench_id']}-global"
+    return kwargs
+
+
+def _group_of(name, groups):
+    # B7 e B7.global (peer global do coordenador B7) ficam no grupo 7 % groups
+    return int(name[1:].split(".")[0]) % groups
+
+
+def _tags(config, name):
+    if config["algorithm"] == "hier":
+        return (group_tag(f"{config['bench_id']}-g{_group_of(name, config['groups'])}"),)
+    return (group_tag(config["bench_id"]),)
+
+
+def _peer_stats(p):
+    info = p.info()
+    # chamadas Pyro e bytes na rede (pedido + resposta), contados por quem chama
+    return dict(info["stats"], rpc_calls=info["proxy_pool"]["calls"],
+                rpc_bytes=info["proxy_pool"]["bytes_sent"] + info["proxy_pool"]["bytes_received"],
+                sent_to=p.metrics()["msgs_sent_to"])
+
+
+def run_worker(config, names, barrier, results):
+    """
+    Hospeda os peers `names`, espera todos os processos registrarem os seus,
+    roda a carga e põe em `results` os eventos de SC e as estatísticas de cada peer.
+    `barrier` sincroniza as fases entre processos; os peers continuam servindo até
+    a última barreira, para que ninguém saia enquanto outros ainda pedem a SC.
+    """
+    ns = Pyro5.api.locate_ns(host=config["ns_host"], port=config["ns_port"])
+    peer_class = ALGORITHMS[config["algorithm"]]
+    runtime = AsyncRuntime() if config["runtime"] == "async" else None
+    peers = []
+    shared = Pyro5.api.Daemon(host="localhost") if config["colocate"] else None
+    if shared is not None:
+        threading.Thread(target=shared.requestLoop, daemon=True).start()
+    for nm in names:
+        p = peer_class(name=nm, runtime=runtime, **_peer_kwargs(config))
+        if shared is not None:
+            uri = local_transport.host(shared, p)
+        else:
+            daemon = Pyro5.api.Daemon(host="localhost")
+            uri = daemon.register(p)
+            p.uri = str(uri)
+            threading.Thread(target=daemon.requestLoop, daemon=True).start()
+        register_peer(ns, nm, uri, _tags(config, nm))
+        if config["net_delay"] or config["net_jitter"] or config["net_drop"]:
+            p.set_network_faults(config["net_delay"], config["net_jitter"], config["net_drop"])
+        peers.append(p)
+
+    barrier.wait()
+    for p in peers:
+        p.update_peers_from_nameserver(ns, _tags(config, p.name))
+    barrier.wait()
+    if config["algorithm"] == "hier":
+        # coordenadores sobem os peers globais antes da carga (grupo de um só peer também)
+        for p in peers:
+            p.elect(force=p.coordinator() == p.name)
+        barrier.wait()
+
+    events = []
+    events_lock = threading.Lock()
+
+    def workload(p, rng):
+        for _ in range(config["cycles"]):
+            if config["think"] > 0:
+                time.sleep(rng.expovariate(1.0 / config["think"]))
+            resource = DEFAULT_RESOURCE if config["resources"] == 1 else f"r{rng.randrange(config['resources'])}"
+            mode = READ if rng.random() < config["read_ratio"] else WRITE
+            requested = time.time()
+            ok = p.request_cs(resource, mode)
+            entered = time.time()
+            if ok:
+                time.sleep(config["hold"])
+                exited = time.time()
+                p.release_cs(resource)
+            else:
+                exited = None
+            with events_lock:
+                events.append((p.name, resource, mode, ok, requested, entered, exited))
+
+    threads = [threading.Thread(target=workload, args=(p, random.Random(p.name))) for p in peers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    stats = {}
+    for p in peers:
+        stats[p.name] = _peer_stats(p)
+        if getattr(p, "global_peer", None) is not None:
+            stats[p.global_peer.name] = _peer_stats(p.global_peer)
+    results.put({"events": events, "stats": stats,
+                 "threads": threading.active_count()})
+    barrier.wait()
+    for p in peers:
+        p.shutdown()
+
+
+def _summary_ms(values):
+    return {
+        "mean": round(1000 * sum(values) / len(values), 3) if values else 0.0,
+        "p50": round(1000 * percentile(values, 50), 3),
+        "p99": round(1000 * percentile(values, 99), 3),
+        "max": round(1000 * max(values), 3) if values else 0.0,
+    }
+
+
+def sync_delays(events):
+    """
+    Atraso de sincronização: entre a saída de um detentor e a entrada do próximo,
+    contado só quando o próximo já estava esperando e os dois acessos conflitam
+    (mesmo recurso, ao menos um WRITE). Entradas simultâneas (leitores, k>1) não contam.
+    """
+    delays = []
+    by_resource = {}
+    for _, resource, mode, ok, requested, entered, exited in events:
+        if ok:
+            by_resource.setdefault(resource, []).append((entered, exited, requested, mode))
+    for entries in by_resource.values():
+        entries.sort()
+        for prev, cur in zip(entries, entries[1:]):
+            prev_exit, prev_mode = prev[1], prev[3]
+            entered, requested, mode = cur[0], cur[2], cur[3]
+            if READ == mode == prev_mode or requested >= prev_exit or entered < prev_exit:
+                continue
+            delays.append(entered - prev_exit)
+    return delays
+
+
+def summarize(config, events, stats, wall):
+    granted = [e for e in events if e[3]]
+    latencies = [entered - requested for _, _, _, ok, requested, entered, _ in granted]
+    entries = len(granted)
+    msgs = sum(s["msgs_sent"] for s in stats.values())
+    background = sum(s["hb_sent"] + s["hb_acks"] for s in stats.values())
+    result = {
+        "config": {k: v for k, v in config.items() if k != "bench_id"},
+        "entries": entries,
+        "failures": len(events) - entries,
+        "duration_s": round(wall, 3),
+        "throughput_per_s": round(entries / wall, 3) if wall > 0 else 0.0,
+        "entry_latency_ms": _summary_ms(latencies),
+        "sync_delay_ms": _summary_ms(sync_delays(events)),
+        "msgs_total": msgs,
+        "msgs_heartbeat": background,
+        # só mensagens do protocolo (pedidos, respostas, votos, token...), sem heartbeats
+        "msgs_per_entry": round((msgs - background) / entries, 3) if entries else 0.0,
+    }
+    if all("rpc_calls" in s for s in stats.values()):
+        # com lotes (deliver) uma chamada leva várias mensagens; inclui heartbeats
+        calls = sum(s["rpc_calls"] for s in stats.values())
+        wire = sum(s["rpc_bytes"] for s in stats.values())
+        result["calls_per_entry"] = round(calls / entries, 3) if entries else 0.0
+        result["bytes_per_entry"] = round(wire / entries, 1) if entries else 0.0
+    if config.get("groups", 1) > 1:
+        # mensagens de protocolo cujo destino está em outro grupo (ex.: entre datacenters)
+        groups = config["groups"]
+        cross = sum(n for nm, s in stats.items() for dest, n in s["sent_to"].items()
+                    if _group_of(nm, groups) != _group_of(dest, groups))
+        result["msgs_cross_group"] = cross
+        result["cross_group_msgs_per_entry"] = round(cross / entries, 3) if entries else 0.0
+    return result
+
+
+def run(config):
+    names = [f"B{i}" for i in range(config["peers"])]
+    parts = [names[i::config["processes"]] for i in range(config["processes"])]
+    start = time.time()
+    if config["processes"] == 1:
+        results = queue.Queue()
+        run_worker(config, parts[0], threading.Barrier(1), results)
+        collected = [results.get()]
+    else:
+        ctx = multiprocessing.get_context("spawn")
+        barrier = ctx.Barrier(config["processes"])
+        results = ctx.Queue()
+        procs = [ctx.Process(target=run_worker, args=(config, part, barrier, results)) for part in parts]
+        for proc in procs:
+            proc.start()
+        collected = [results.get() for _ in procs]
+        for proc in procs:
+            proc.join()
+    events = [e for r in collected for e in r["events"]]
+    stats = {nm: s for r in collected for nm, s in r["stats"].items()}
+    granted = [e for e in events if e[3]]
+    # a janela medida vai do primeiro pedido à última saída (não inclui subir os peers)
+    if granted:
+        wall = max(e[6] for e in granted) - min(e[4] for e in events)
+    else:
+        wall = time.time() - start
+    result = summarize(config, events, stats, wall)
+    # threads vivas ao fim da carga, somadas entre os processos (inclui as do Pyro)
+    result["threads"] = sum(r["threads"] for r in collected)
+    return result
+
+
+def main():
+    args = parse_args()
+    config = vars(args).copy()
+    output = config.pop("output")
+    # grupo próprio no NameServer: o benchmark não enxerga (nem atrapalha) peers de verdade
+    config["bench_id"] = f"bench-{os.getpid()}-{int(time.time())}"
+    with contextlib.redirect_stdout(sys.stderr):
+        get_or_start_nameserver(host=args.ns_host, port=args.ns_port)
+    result = run(config)
+    text = json.dumps(result, indent=2)
+    print(text)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
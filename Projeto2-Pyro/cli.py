@@ -1,17 +1,309 @@
 # cli.py
 # Interface simples para interagir com um peer já em execução.
 # Uso: python cli.py <PeerName> <peer_uri>  OR para procurar via nameserver: python cli.py <PeerName> --ns
+#      [--serializer serpent|marshal|json|msgpack] em qualquer posição
+#      Carga scriptada, sem menu: python cli.py load <PeerName|peer_uri> [...] [opções]  (ver load --help)
+#      Linha do tempo ao vivo de todos os peers do NameServer: python cli.py watch [opções]  (ver watch --help)
+import argparse
+import csv
+import json
+import random
 import sys
+import threading
 import time
 import Pyro5.api
+import Pyro5.errors
+import Pyro5.serializers
+from event_feed import EVENT_TYPES
+from metrics import percentile
+from nameserver_helper import group_tag, list_peers
 
 def usage():
     print("Uso:")
     print("  python cli.py <PeerName> <peer_uri>")
     print("  python cli.py <PeerName> --ns [ns_host ns_port]  # procura URI no nameserver")
+    print(f"  --serializer {{{','.join(sorted(Pyro5.serializers.serializers))}}}  # serializador das chamadas ao peer")
+    print("  python cli.py load <PeerName|peer_uri> [...] [opções]  # gera carga; load --help lista as opções")
+    print("  python cli.py watch [opções]  # eventos de todos os peers numa linha do tempo; watch --help")
     sys.exit(1)
 
+def pop_serializer():
+    # retira "--serializer NOME" de sys.argv; None mantém o padrão do Pyro
+    if "--serializer" not in sys.argv:
+        return None
+    i = sys.argv.index("--serializer")
+    if i + 1 >= len(sys.argv) or sys.argv[i + 1] not in Pyro5.serializers.serializers:
+        usage()
+    serializer = sys.argv[i + 1]
+    del sys.argv[i:i + 2]
+    return serializer
+
+def parse_load_args(argv):
+    parser = argparse.ArgumentParser(prog="python cli.py load",
+                                     usage="python cli.py load [PeerName|peer_uri ...] [opções]")
+    parser.add_argument("targets", nargs="*",
+                        help="URIs (PYRO:...) ou nomes procurados no NameServer; sem nenhum, "
+                             "todos os peers do NameServer (ou do --group)")
+    parser.add_argument("--ns", nargs=2, metavar=("HOST", "PORT"), default=("localhost", "9090"),
+                        help="NameServer para resolver nomes (padrão: localhost 9090)")
+    parser.add_argument("--group", default=None, help="sem alvos: só os peers deste grupo")
+    parser.add_argument("--cycles", type=int, default=20, help="pedidos de SC por chamador")
+    parser.add_argument("--callers", type=int, default=1,
+                        help="chamadores concorrentes por peer (cada um com seu proxy); com um pedido do "
+                             "recurso já pendente no peer, o request_cs dos demais é negado")
+    parser.add_argument("--hold", type=float, default=0.01, help="tempo médio (s) dentro da SC")
+    parser.add_argument("--hold-dist", choices=("const", "uniform", "exp"), default="const",
+                        help="distribuição do tempo na SC: const, uniform em [0, 2*hold] ou exponencial")
+    parser.add_argument("--think", type=float, default=0.0,
+                        help="pausa média (s, exponencial) entre uma saída e o próximo pedido")
+    parser.add_argument("--resources", type=int, default=1,
+                        help="recursos distintos; cada pedido sorteia um (1 = recurso padrão)")
+    parser.add_argument("--read-ratio", type=float, default=0.0, help="fração dos pedidos em modo READ")
+    parser.add_argument("--timeout", type=float, default=30.0,
+                        help="prazo (s) de cada chamada; um request_cs que estoura conta como timeout "
+                             "(se o peer entrar depois, a posse expira pelo access_time_limit)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--format", choices=("text", "csv", "json"), default="text",
+                        help="text: resumo; csv: uma linha por operação; json: resumo e operações (records)")
+    parser.add_argument("--output", help="grava a saída neste arquivo em vez do stdout")
+    return parser.parse_args(argv)
+
+
+def resolve_targets(args):
+    # {nome: uri}; para uma URI o nome é o do objeto, que não é o do peer, mas basta para o relatório
+    ns = None
+    targets = {}
+    for t in args.targets:
+        if t.startswith("PYRO:"):
+            targets[t] = t
+            continue
+        ns = ns or Pyro5.api.locate_ns(host=args.ns[0], port=int(args.ns[1]))
+        targets[t] = str(ns.lookup(t))
+    if not targets:
+        ns = Pyro5.api.locate_ns(host=args.ns[0], port=int(args.ns[1]))
+        targets = list_peers(ns, (group_tag(args.group),) if args.group else ())
+    return targets
+
+
+def run_load(argv, serializer=None):
+    """
+    Carga não interativa: `callers` threads por peer repetem request_cs -> SC -> release_cs,
+    cada uma com seu proxy. Registra latência e desfecho de cada operação:
+    ok, denied (o peer retornou False), timeout ou error.
+    """
+    args = parse_load_args(argv)
+    targets = resolve_targets(args)
+    if not targets:
+        print("Nenhum peer encontrado.")
+        sys.exit(1)
+    rng = random.Random(args.seed)
+    ops = []
+    ops_lock = threading.Lock()
+
+    def hold_time(r):
+        if args.hold_dist == "uniform":
+            return r.uniform(0, 2 * args.hold)
+        if args.hold_dist == "exp":
+            return r.expovariate(1.0 / args.hold) if args.hold > 0 else 0.0
+        return args.hold
+
+    def call(proxy, peer, caller, cycle, op, method, *call_args):
+        started = time.time()
+        try:
+            result = getattr(proxy, method)(*call_args)
+            outcome = "ok" if result else "denied"
+        except Pyro5.errors.TimeoutError:
+            outcome = "timeout"
+            # a conexão pode ter ficado com a resposta atrasada: o próximo uso reconecta
+            proxy._pyroRelease()
+        except Exception:
+            outcome = "error"
+            proxy._pyroRelease()
+        with ops_lock:
+            ops.append((peer, caller, cycle, op, started, time.time() - started, outcome))
+        return outcome
+
+    def caller_loop(peer, uri, caller, r):
+        proxy = Pyro5.api.Proxy(uri)
+        proxy._pyroTimeout = args.timeout
+        if serializer:
+            proxy._pyroSerializer = serializer
+        with proxy:
+            for cycle in range(args.cycles):
+                if args.think > 0:
+                    time.sleep(r.expovariate(1.0 / args.think))
+                resource = "default" if args.resources == 1 else f"r{r.randrange(args.resources)}"
+                mode = "READ" if r.random() < args.read_ratio else "WRITE"
+                if call(proxy, peer, caller, cycle, "request_cs", "request_cs", resource, mode) == "ok":
+                    time.sleep(hold_time(r))
+                    call(proxy, peer, caller, cycle, "release_cs", "release_cs", resource)
+
+    threads = [threading.Thread(target=caller_loop, args=(peer, uri, c, random.Random(rng.random())))
+               for peer, uri in targets.items() for c in range(args.callers)]
+    print(f"Carga em {len(targets)} peer(s), {args.callers} chamador(es) por peer, {args.cycles} ciclos cada...",
+          file=sys.stderr)
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.time() - start
+
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        if args.format == "csv":
+            writer = csv.writer(out)
+            writer.writerow(("peer", "caller", "cycle", "op", "start", "latency_ms", "outcome"))
+            for peer, caller, cycle, op, started, latency, outcome in sorted(ops, key=lambda o: o[4]):
+                writer.writerow((peer, caller, cycle, op, round(started, 6), round(1000 * latency, 3), outcome))
+            return
+        summary = summarize_load(args, targets, ops, wall)
+        if args.format == "json":
+            summary["records"] = [dict(zip(("peer", "caller", "cycle", "op", "start", "latency_ms", "outcome"),
+                                       (p, c, n, op, round(s, 6), round(1000 * lat, 3), o)))
+                              for p, c, n, op, s, lat, o in sorted(ops, key=lambda o: o[4])]
+            out.write(json.dumps(summary, indent=2) + "\n")
+        else:
+            print_load_summary(summary, out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+def summarize_load(args, targets, ops, wall):
+    summary = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("format", "output")},
+        "peers": sorted(targets),
+        "duration_s": round(wall, 3),
+        "ops": {},
+    }
+    for op in ("request_cs", "release_cs"):
+        done = [o for o in ops if o[3] == op]
+        latencies = [o[5] for o in done if o[6] == "ok"]
+        summary["ops"][op] = {
+            "count": len(done),
+            **{outcome: sum(1 for o in done if o[6] == outcome) for outcome in ("ok", "denied", "timeout", "error")},
+            # latência só das operações bem-sucedidas, em ms
+            "p50_ms": round(1000 * percentile(latencies, 50), 3),
+            "p95_ms": round(1000 * percentile(latencies, 95), 3),
+            "p99_ms": round(1000 * percentile(latencies, 99), 3),
+            "max_ms": round(1000 * max(latencies), 3) if latencies else 0.0,
+        }
+    entries = summary["ops"]["request_cs"]["ok"]
+    summary["entries"] = entries
+    summary["throughput_per_s"] = round(entries / wall, 3) if wall > 0 else 0.0
+    return summary
+
+
+def print_load_summary(summary, out):
+    print(f"Peers: {', '.join(summary['peers'])}", file=out)
+    print(f"Duração: {summary['duration_s']}s  entradas: {summary['entries']}  "
+          f"vazão: {summary['throughput_per_s']}/s", file=out)
+    print(f"  {'operação':<12}{'n':>7}{'ok':>7}{'negado':>8}{'timeout':>9}{'erro':>6}"
+          f"{'p50':>10}{'p95':>10}{'p99':>10}{'máx':>10}  (ms)", file=out)
+    for op, s in summary["ops"].items():
+        print(f"  {op:<12}{s['count']:>7}{s['ok']:>7}{s['denied']:>8}{s['timeout']:>9}{s['error']:>6}"
+              f"{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}{s['max_ms']:>10}", file=out)
+
+
+def parse_watch_args(argv):
+    parser = argparse.ArgumentParser(prog="python cli.py watch", usage="python cli.py watch [opções]")
+    parser.add_argument("--ns", nargs=2, metavar=("HOST", "PORT"), default=("localhost", "9090"),
+                        help="NameServer onde os peers são procurados (padrão: localhost 9090)")
+    parser.add_argument("--group", default=None, help="só os peers deste grupo")
+    parser.add_argument("--interval", type=float, default=1.0, help="intervalo (s) entre consultas aos peers")
+    parser.add_argument("--delay", type=float, default=None,
+                        help="atraso (s) da exibição para intercalar eventos que chegam fora de ordem "
+                             "(padrão: --interval)")
+    parser.add_argument("--types", default=",".join(EVENT_TYPES),
+                        help="tipos de evento exibidos, separados por vírgula (as taxas contam todos)")
+    parser.add_argument("--history", action="store_true",
+                        help="mostra também os eventos já no buffer dos peers ao conectar")
+    parser.add_argument("--duration", type=float, default=0.0, help="encerra após N s (0 = até CTRL+C)")
+    return parser.parse_args(argv)
+
+
+def run_watch(argv, serializer=None):
+    """
+    Consulta periodicamente Peer.events() de todos os peers do NameServer e mostra os
+    eventos numa só linha do tempo, ordenada pelo relógio de Lamport (desempate pela
+    hora), mais as taxas por segundo de cada tipo de evento na última consulta.
+    """
+    args = parse_watch_args(argv)
+    delay = args.interval if args.delay is None else args.delay
+    shown = {t.strip().upper() for t in args.types.split(",") if t.strip()}
+    ns = Pyro5.api.locate_ns(host=args.ns[0], port=int(args.ns[1]))
+    tags = (group_tag(args.group),) if args.group else ()
+    proxies = {}
+    last_seq = {}
+    pending = []
+    start = last_round = time.time()
+
+    def show(events):
+        for clock, ts, name, kind, resource, detail in events:
+            stamp = time.strftime("%H:%M:%S", time.localtime(ts)) + f".{int(ts % 1 * 1000):03d}"
+            print(f"{clock:>7} {stamp} {name:<10} {kind:<8} {resource or '-':<10} {detail or ''}")
+
+    try:
+        while not args.duration or time.time() - start < args.duration:
+            found = list_peers(ns, tags)
+            for name in set(proxies) - set(found):
+                proxies.pop(name)._pyroRelease()
+                last_seq.pop(name, None)
+                print(f"-- {name} saiu do NameServer")
+            counts = dict.fromkeys(EVENT_TYPES, 0)
+            for name, uri in sorted(found.items()):
+                proxy = proxies.get(name)
+                if proxy is None:
+                    proxy = proxies[name] = Pyro5.api.Proxy(uri)
+                    proxy._pyroTimeout = max(args.interval, 1.0)
+                    if serializer:
+                        proxy._pyroSerializer = serializer
+                try:
+                    feed = proxy.events(last_seq.get(name, 0))
+                except Exception as e:
+                    print(f"-- {name} não respondeu: {e}")
+                    proxy._pyroRelease()
+                    continue
+                events = feed["events"]
+                first_contact = name not in last_seq
+                last_seq[name] = events[-1][0] if events else last_seq.get(name, 0)
+                if not events or (first_contact and not args.history):
+                    continue
+                if feed["lost"] and not first_contact:
+                    print(f"-- {name}: {feed['lost']} eventos perdidos (buffer cheio entre consultas)")
+                for _, ts, clock, kind, resource, detail in events:
+                    counts[kind] = counts.get(kind, 0) + 1
+                    if kind in shown:
+                        pending.append((clock, ts, name, kind, resource, detail))
+            # só exibe o que tem mais de `delay` s: eventos atrasados ainda entram na ordem certa
+            pending.sort(key=lambda e: (e[0], e[1], e[2]))
+            cutoff = time.time() - delay
+            ready = [e for e in pending if e[1] <= cutoff]
+            pending = [e for e in pending if e[1] > cutoff]
+            show(ready)
+            now = time.time()
+            elapsed = max(now - last_round, 1e-6)
+            last_round = now
+            rates = "  ".join(f"{kind} {n / elapsed:.1f}" for kind, n in counts.items())
+            print(f"== {len(found)} peers | taxa/s: {rates}")
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        show(pending)
+        for proxy in proxies.values():
+            proxy._pyroRelease()
+
+
 def main():
+    serializer = pop_serializer()
+    if len(sys.argv) > 1 and sys.argv[1] == "load":
+        run_load(sys.argv[2:], serializer)
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "watch":
+        run_watch(sys.argv[2:], serializer)
+        return
     if len(sys.argv) < 3:
         usage()
     name = sys.argv[1]
@@ -30,6 +322,8 @@ def main():
     print(f"Conectando a {name} em {uri}")
     try:
         proxy = Pyro5.api.Proxy(uri)
+        if serializer:
+            proxy._pyroSerializer = serializer
     except Exception as e:
         print("Falha ao criar proxy:", e)
         sys.exit(1)
@@ -41,21 +335,56 @@ def main():
         print(" 3 - list_peers")
         print(" 4 - info")
         print(" 5 - shutdown peer (desregistrar e desligar)")
+        print(" 6 - renew_cs (estender a posse da seção crítica)")
+        print(" 7 - falhas de rede (atraso, jitter, perda)")
+        print(" 8 - partição (peers inalcançáveis a partir deste)")
+        print(" 9 - limpar falhas de rede")
+        print(" stats - métricas (latências por fase, mensagens por tipo)")
         print(" q - sair CLI")
 
+    def ask_resource():
+        return input("Recurso (enter = default): ").strip() or "default"
+
+    def ask_mode():
+        mode = input("Modo [r = leitura compartilhada, w = escrita exclusiva] (enter = w): ").strip().lower()
+        return "READ" if mode.startswith("r") else "WRITE"
+
+    def ask_peers(prompt):
+        names = input(prompt).strip()
+        return [nm.strip() for nm in names.split(",") if nm.strip()]
+
+    def ask_float(prompt):
+        value = input(prompt).strip()
+        return float(value) if value else 0.0
+
+    def print_metrics(m):
+        print(f"Métricas de {m['name']}:")
+        print(f"  {'fase':<12}{'n':>7}{'média':>10}{'p50':>10}{'p90':>10}{'p99':>10}{'máx':>10}  (ms)")
+        for phase, h in m["latency"].items():
+            print(f"  {phase:<12}{h['count']:>7}{h['mean_ms']:>10}{h['p50_ms']:>10}"
+                  f"{h['p90_ms']:>10}{h['p99_ms']:>10}{h['max_ms']:>10}")
+        for phase, peers in m["per_peer"].items():
+            per_peer = ", ".join(f"{nm} p50={h['p50_ms']} p99={h['p99_ms']}" for nm, h in peers.items())
+            print(f"  {phase} por peer: {per_peer}")
+        print("  enviadas:", m["msgs_sent"])
+        print("  recebidas:", m["msgs_received"])
+        print("  REPLYs adiados:", m["deferred_depth"])
+        pool = m["proxy_pool"]
+        print(f"  proxies: reconexões={pool['reconnects']} timeouts={pool['timeouts']} falhas={pool['failures']}")
+
     while True:
         print_menu()
         cmd = input("Escolha: ").strip()
         if cmd == "1":
             try:
-                ok = proxy.request_cs()
+                ok = proxy.request_cs(ask_resource(), ask_mode())
                 print("request_cs ->", ok)
             except Exception as e:
                 print("Erro calling request_cs:", e)
         elif cmd == "2":
             try:
-                proxy.release_cs()
-                print("release_cs enviado.")
+                released = proxy.release_cs(ask_resource())
+                print("release_cs ->", released)
             except Exception as e:
                 print("Erro calling release_cs:", e)
         elif cmd == "3":
@@ -76,6 +405,40 @@ def main():
                 print("Shutdown solicitado ao peer (ele seguirá desligando).")
             except Exception as e:
                 print("Erro calling shutdown:", e)
+        elif cmd == "6":
+            try:
+                lease = proxy.renew_cs(ask_resource())
+                print(f"renew_cs -> {lease:.1f}s de posse restantes")
+            except Exception as e:
+                print("Erro calling renew_cs:", e)
+        elif cmd == "7":
+            try:
+                delay = ask_float("Atraso em s (enter = 0): ")
+                jitter = ask_float("Jitter em s (enter = 0): ")
+                drop = ask_float("Probabilidade de perda 0-1 (enter = 0): ")
+                peers = ask_peers("Peers destino, separados por vírgula (enter = todos): ")
+                faults = proxy.set_network_faults(delay, jitter, drop, peers or None)
+                print("Falhas de rede:", faults)
+            except Exception as e:
+                print("Erro calling set_network_faults:", e)
+        elif cmd == "8":
+            try:
+                peers = ask_peers("Peers a isolar, separados por vírgula (enter = desfaz a partição): ")
+                faults = proxy.set_partition(peers)
+                print("Falhas de rede:", faults)
+            except Exception as e:
+                print("Erro calling set_partition:", e)
+        elif cmd == "9":
+            try:
+                proxy.clear_network_faults()
+                print("Falhas de rede removidas.")
+            except Exception as e:
+                print("Erro calling clear_network_faults:", e)
+        elif cmd.lower() == "stats":
+            try:
+                print_metrics(proxy.metrics())
+            except Exception as e:
+                print("Erro calling metrics:", e)
         elif cmd.lower() == "q":
             print("Saindo CLI.")
             break
@@ -0,0 +1,52 @@
+# event_feed.py
+# Eventos estruturados do protocolo de cada Peer num buffer circular de tamanho fixo.
+# Gravar um evento é montar uma tupla e um append num deque sob um lock curto; ninguém
+# formata texto nem faz I/O. Quem quer acompanhar (cli.py watch) busca os eventos
+# novos com Peer.events(since) e os intercala pelo relógio de Lamport.
+import itertools
+import threading
+import time
+from collections import deque
+
+REQUEST = "REQUEST"   # pedido nosso; detalhe: modo
+REPLY = "REPLY"       # permissão recebida (REPLY, voto ou token); detalhe: quem deu
+DEFER = "DEFER"       # pedido de outro peer adiado; detalhe: quem pediu
+ENTER = "ENTER"       # entrada na SC; detalhe: modo
+EXIT = "EXIT"         # saída da SC
+REMOVE = "REMOVE"     # peer removido da lista de ativos; detalhe: o peer
+EVENT_TYPES = (REQUEST, REPLY, DEFER, ENTER, EXIT, REMOVE)
+
+# campos de cada evento, na ordem das tuplas
+FIELDS = ("seq", "time", "clock", "type", "resource", "detail")
+
+
+class EventFeed:
+    """
+    Os `capacity` eventos mais recentes. Cada evento é a tupla
+    (seq, time, clock, type, resource, detail); seq cresce sem buracos, então
+    quem lê sabe quantos eventos perdeu se demorou mais que o buffer aguenta.
+    """
+
+    def __init__(self, capacity=1024):
+        self._events = deque(maxlen=capacity)
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+        self.capacity = capacity
+
+    def record(self, kind, clock, resource, detail=None):
+        if not self.capacity:
+            return
+        with self._lock:
+            self._events.append((next(self._seq), time.time(), clock, kind, resource, detail))
+
+    def since(self, seq=0, limit=None):
+        """
+        Eventos com seq > `seq` (os `limit` mais antigos deles, se dado) e quantos
+        foram descartados pelo buffer antes de serem lidos.
+        """
+        with self._lock:
+            events = [e for e in self._events if e[0] > seq] if seq else list(self._events)
+        lost = max(events[0][0] - seq - 1, 0) if events else 0
+        if limit is not None:
+            events = events[:limit]
+        return {"events": events, "lost": lost}
@@ -0,0 +1,117 @@
+# failure_detector.py
+# Detector de falhas phi-accrual (Hayashibara et al.), no estilo do usado pelo Akka/Cassandra.
+# Em vez de "morto depois de X segundos", calcula um nível de suspeita contínuo (phi)
+# a partir da distribuição dos intervalos entre heartbeats de cada peer.
+import math
+import threading
+import time
+from collections import deque
+
+
+class _History:
+    __slots__ = ("last", "intervals", "total", "total_sq")
+
+    def __init__(self, now):
+        self.last = now
+        self.intervals = deque()
+        self.total = 0.0
+        self.total_sq = 0.0
+
+
+class PhiAccrualDetector:
+    """
+    Mantém, por peer, uma janela dos intervalos entre chegadas de mensagens.
+    phi = -log10(P(um heartbeat ainda chegar depois de tanto silêncio)),
+    assumindo intervalos com distribuição normal. phi=8 equivale a ~1e-8 de chance
+    de estarmos suspeitando de um peer vivo.
+
+    Chegadas mais próximas que `min_interval` não viram amostra (só avançam o
+    último instante), para que rajadas de REQUEST/REPLY não encolham a média e
+    tornem o silêncio normal entre heartbeats suspeito.
+    """
+
+    def __init__(self, threshold=8.0, window_size=100, min_interval=0.5, min_std=0.5,
+                 acceptable_pause=0.0, first_interval=1.5):
+        self.threshold = threshold
+        self.window_size = window_size
+        self.min_interval = min_interval
+        self.min_std = min_std
+        self.acceptable_pause = acceptable_pause
+        self.first_interval = first_interval
+        self._lock = threading.Lock()
+        self._history = {}
+
+    def heartbeat(self, peer, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            hist = self._history.get(peer)
+            if hist is None:
+                hist = self._history[peer] = _History(now)
+                # amostras iniciais estimadas enquanto ainda não há medições reais
+                self._add(hist, self.first_interval - self.first_interval / 4)
+                self._add(hist, self.first_interval + self.first_interval / 4)
+                return
+            interval = now - hist.last
+            if interval <= 0:
+                return
+            hist.last = now
+            if interval >= self.min_interval:
+                self._add(hist, interval)
+
+    def _add(self, hist, interval):
+        hist.intervals.append(interval)
+        hist.total += interval
+        hist.total_sq += interval * interval
+        if len(hist.intervals) > self.window_size:
+            old = hist.intervals.popleft()
+            hist.total -= old
+            hist.total_sq -= old * old
+
+    def _stats(self, hist):
+        n = len(hist.intervals)
+        mean = hist.total / n
+        variance = max(hist.total_sq / n - mean * mean, 0.0)
+        return mean, max(math.sqrt(variance), self.min_std)
+
+    def phi(self, peer, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            hist = self._history.get(peer)
+            if hist is None:
+                return 0.0
+            mean, std = self._stats(hist)
+            elapsed = now - hist.last
+        return _phi(elapsed, mean + self.acceptable_pause, std)
+
+    def is_suspected(self, peer, now=None):
+        return self.phi(peer, now) > self.threshold
+
+    def remove(self, peer):
+        with self._lock:
+            self._history.pop(peer, None)
+
+    def snapshot(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            items = [(peer, self._stats(hist), now - hist.last, len(hist.intervals))
+                     for peer, hist in self._history.items()]
+        return {
+            peer: {
+                "phi": round(_phi(elapsed, mean + self.acceptable_pause, std), 3),
+                "mean_interval": round(mean, 4),
+                "std_interval": round(std, 4),
+                "silence": round(elapsed, 4),
+                "samples": samples,
+            }
+            for peer, (mean, std), elapsed, samples in items
+        }
+
+
+def _phi(elapsed, mean, std):
+    # aproximação logística da CDF normal (mesma usada pelo Akka)
+    # y é limitado para evitar overflow/underflow em exp(); phi ~259 já é "certamente morto"
+    y = max(-20.0, min(20.0, (elapsed - mean) / std))
+    e = math.exp(-y * (1.5976 + 0.070566 * y * y))
+    if elapsed > mean:
+        return -math.log10(e / (1.0 + e))
+    return -math.log10(1.0 - 1.0 / (1.0 + e))
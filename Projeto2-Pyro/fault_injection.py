@@ -0,0 +1,104 @@
+# fault_injection.py
+# Camada de injeção de falhas sobre o ProxyPool: atraso, jitter, perda de mensagens e
+# partições por destino, para reproduzir numa máquina só as latências e falhas de uma
+# rede de verdade. Sem regras configuradas as chamadas vão direto ao pool.
+import random
+import threading
+import time
+import Pyro5.errors
+
+
+class FaultInjector:
+    """
+    Embrulha um ProxyPool com a mesma interface (call/evict/close/stats).
+    As regras valem para as mensagens que este peer envia: `defaults` para todo
+    destino e `links` por nome de peer, sobrepondo os padrões. Destinos em
+    `partition` ficam inalcançáveis (CommunicationError, como conexão recusada).
+    Para cortar o tráfego nos dois sentidos, configure a partição nos dois lados.
+
+      delay  -- atraso fixo (s) antes de cada envio
+      jitter -- atraso extra sorteado uniformemente em [0, jitter]
+      drop   -- probabilidade de descartar a mensagem
+    """
+
+    RULES = ("delay", "jitter", "drop")
+
+    def __init__(self, pool, seed=None):
+        self.pool = pool
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self.defaults = dict.fromkeys(self.RULES, 0.0)
+        self.links = {}          # peer_name -> regras próprias do enlace
+        self.partition = set()
+        self.counters = {"delayed": 0, "dropped": 0, "partitioned": 0}
+
+    def configure(self, delay=0.0, jitter=0.0, drop=0.0, peers=None):
+        # peers=None troca as regras padrão; senão, as dos enlaces para `peers`
+        if delay < 0 or jitter < 0 or not 0.0 <= drop <= 1.0:
+            raise ValueError(f"regras inválidas: delay={delay} jitter={jitter} drop={drop}")
+        rules = {"delay": delay, "jitter": jitter, "drop": drop}
+        with self._lock:
+            if peers is None:
+                self.defaults = rules
+            else:
+                for nm in peers:
+                    self.links[nm] = dict(rules)
+
+    def set_partition(self, peers):
+        with self._lock:
+            self.partition = set(peers)
+
+    def clear(self):
+        with self._lock:
+            self.defaults = dict.fromkeys(self.RULES, 0.0)
+            self.links.clear()
+            self.partition.clear()
+
+    def _count(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+    def call(self, peer_name, uri, method, *args, timeout=None, oneway=False, **kwargs):
+        with self._lock:
+            cut = peer_name in self.partition
+            rules = self.links.get(peer_name, self.defaults)
+            dropped = rules["drop"] > 0 and self._rng.random() < rules["drop"]
+            delay = rules["delay"] + (self._rng.uniform(0, rules["jitter"]) if rules["jitter"] else 0.0)
+
+        if cut:
+            self._count("partitioned")
+            raise Pyro5.errors.CommunicationError(f"{peer_name} inalcançável (partição injetada)")
+        if delay > 0:
+            self._count("delayed")
+            if timeout is not None and delay >= timeout and not oneway:
+                # a resposta chegaria depois do prazo: o chamador vê o mesmo erro de um peer lento
+                time.sleep(timeout)
+                raise Pyro5.errors.TimeoutError(f"{method} para {peer_name}: atraso injetado {delay:.3f}s")
+            time.sleep(delay)
+        if dropped:
+            self._count("dropped")
+            if oneway:
+                # oneway perdido passa despercebido por quem envia
+                return None
+            if timeout is not None:
+                time.sleep(timeout)
+            raise Pyro5.errors.TimeoutError(f"{method} para {peer_name} descartado (perda injetada)")
+        return self.pool.call(peer_name, uri, method, *args, timeout=timeout, oneway=oneway, **kwargs)
+
+    def evict(self, peer_name):
+        self.pool.evict(peer_name)
+
+    def close(self):
+        self.pool.close()
+
+    def stats(self):
+        return self.pool.stats()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "defaults": dict(self.defaults),
+                "links": {nm: dict(r) for nm, r in self.links.items()},
+                "partition": sorted(self.partition),
+                "counters": dict(self.counters),
+            }
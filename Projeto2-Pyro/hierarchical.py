@@ -0,0 +1,246 @@
+# hierarchical.py
+# Exclusão mútua em dois níveis (cluster de clusters): os peers de um grupo (--group)
+# disputam a SC entre si com Ricart & Agrawala, e só o vencedor local pede a SC global,
+# por intermédio do coordenador do grupo. Apenas os coordenadores participam do nível
+# global, então as mensagens entre grupos por entrada caem de O(N) para O(grupos).
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import Pyro5.api
+import local_transport
+from nameserver_helper import get_ns, group_tag, register_peer
+from peer import DEFAULT_RESOURCE, HELD, WRITE, Peer, _Ticket
+
+# grupo do NameServer onde os coordenadores registram seus peers globais
+GLOBAL_GROUP = "hier-global"
+
+
+@Pyro5.api.expose
+@Pyro5.api.behavior(instance_mode="single")
+class HierarchicalPeer(Peer):
+    """
+    Mesmo API do Peer. O coordenador do grupo é o menor nome vivo segundo o
+    heartbeat/detector de falhas; quando um peer se vê coordenador, cria um Peer
+    global (`<nome>.global`, no mesmo daemon) registrado em `global_group`.
+    Os peers globais formam um cluster R&A próprio, um por grupo.
+
+    request_cs/request_cs_async: SC local (R&A no grupo) -> hr_acquire no coordenador,
+    que serializa os pedidos do grupo e pede a SC global; o ticket só termina depois
+    dos dois passos. release_cs faz o caminho inverso.
+    Um peer global extra (ex.: antigo coordenador depois da entrada de um nome menor)
+    só custa mensagens: cada um pede a SC global para no máximo um membro por vez.
+    """
+
+    # o coordenador atende um membro por vez: não há leitura compartilhada
+    cs_modes = (WRITE,)
+
+    def __init__(self, name, global_group=GLOBAL_GROUP, **kwargs):
+        self.global_group = global_group
+        self.global_peer = None
+        self._global_lock = threading.Lock()
+        self._global_cond = threading.Condition()
+        self._global_holders = {}   # resource_id -> membro atendido pelo nosso peer global
+        self._global_pending = set()      # recursos cujo hr_acquire ainda espera o peer global
+        self._global_cancelled = set()    # ... e cujo membro desistiu (hr_release) nesse meio tempo
+        self._awaiting_global = set()     # nossos recursos com a SC local, esperando a global (cs_lock)
+        # resource_id -> coordenador que atende nosso pedido global (cs_lock); o hr_release vai
+        # para ele mesmo se, nesse meio tempo, um nome menor virou coordenador
+        self._granted_by = {}
+        # _acquire_global bloqueia até a SC global: fora de Peer._executor, que com o runtime async
+        # é o pool io do processo, do qual os envios do peer global dependem
+        self._global_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix=f"{name}-global")
+        super().__init__(name, **kwargs)
+
+    # ----------------------
+    # Membro
+    # ----------------------
+    def coordinator(self):
+        with self.active_lock:
+            return min(set(self.active_peers) | {self.name})
+
+    def request_cs_async(self, resource_id=DEFAULT_RESOURCE, mode=WRITE):
+        with self.cs_lock:
+            if resource_id in self._awaiting_global:
+                # a SC local já é nossa, mas a global ainda não: nem reentrada nem outro pedido
+                ticket = self._new_ticket()
+                ticket.finish(False)
+                return ticket.id
+        return super().request_cs_async(resource_id, mode)
+
+    def _enter_locked(self, res):
+        # com cs_lock: a SC local é nossa, mas o ticket só termina com a global. A aquisição
+        # aninhada (reentrante) não passa por aqui: a permissão global já é nossa
+        ticket, res.ticket = res.ticket, _Ticket(res.ticket.id)
+        super()._enter_locked(res)
+        # o prazo da posse só corre depois da SC global (ver _acquire_global)
+        self.timers.cancel(res.timer)
+        res.timer = None
+        self._awaiting_global.add(res.id)
+        if not self._stop:
+            self._global_executor.submit(self._acquire_global, res.id, res.timestamp, ticket)
+
+    def _acquire_global(self, resource_id, timestamp, ticket):
+        coordinator = self.coordinator()
+        with self.cs_lock:
+            self._granted_by[resource_id] = coordinator
+        granted = self._global_call("hr_acquire", resource_id, coordinator)
+        with self.cs_lock:
+            self._awaiting_global.discard(resource_id)
+            res = self.resources.get(resource_id)
+            held = res is not None and res.state == HELD and res.timestamp == timestamp
+            if granted and held:
+                res.entered = time.time()
+                res.timer = self.timers.schedule(self.access_time_limit, self._auto_release_cs, resource_id, timestamp)
+                ticket.finish(True)
+                return
+            self._granted_by.pop(resource_id, None)
+        # devolve a global (ou cancela o hr_acquire que o coordenador ainda atende)
+        self._global_call("hr_release", resource_id, coordinator)
+        if held:
+            self.log("Permissão global negada; liberando a SC local.", level="error")
+            self._release(resource_id, timestamp)
+        ticket.finish(False)
+
+    def release_cs(self, resource_id=DEFAULT_RESOURCE):
+        with self.cs_lock:
+            res = self.resources.get(resource_id)
+            last = res is not None and res.state == HELD and res.depth == 1
+            coordinator = self._granted_by.pop(resource_id, None) if last else None
+        if last:
+            # a global primeiro: os outros grupos não esperam pela nossa fila local
+            self._global_call("hr_release", resource_id, coordinator)
+        return super().release_cs(resource_id)
+
+    def renew_cs(self, resource_id=DEFAULT_RESOURCE, extension=None):
+        with self.cs_lock:
+            if resource_id in self._awaiting_global:
+                # ainda sem a SC global: o prazo nem começou
+                return 0.0
+        return super().renew_cs(resource_id, extension)
+
+    def _auto_release_cs(self, resource_id, timestamp):
+        with self.cs_lock:
+            res = self.resources.get(resource_id)
+            held = res is not None and res.state == HELD and res.timestamp == timestamp
+            coordinator = self._granted_by.pop(resource_id, None) if held else None
+        if held:
+            self._global_call("hr_release", resource_id, coordinator)
+        super()._auto_release_cs(resource_id, timestamp)
+
+    def _global_call(self, method, resource_id, coordinator=None):
+        # coordinator=None: o atual
+        coordinator = coordinator or self.coordinator()
+        if coordinator == self.name:
+            return getattr(self, method)(self.name, resource_id)
+        try:
+            # hr_acquire espera a SC global: o prazo cobre a espera na fila do coordenador e a rodada global
+            return self._call(coordinator, method, self.name, resource_id,
+                              timeout=2 * self.reply_timeout + self.send_timeout)
+        except Exception as e:
+            self.log(f"Falha em {method} no coordenador {coordinator}: {e}", level="error")
+            return False
+
+    # ----------------------
+    # Coordenador
+    # ----------------------
+    def hr_acquire(self, member, resource_id=DEFAULT_RESOURCE):
+        # um membro por recurso de cada vez; a fila local já garante que normalmente só há um
+        self.meter.count_received("hr_acquire")
+        deadline = time.time() + self.reply_timeout
+        with self._global_cond:
+            while resource_id in self._global_holders:
+                left = deadline - time.time()
+                if left <= 0:
+                    return False
+                self._global_cond.wait(left)
+            self._global_holders[resource_id] = member
+            self._global_pending.add(resource_id)
+        gp = self.elect(force=True)
+        granted = gp is not None and gp.request_cs(resource_id)
+        with self._global_cond:
+            self._global_pending.discard(resource_id)
+            cancelled = resource_id in self._global_cancelled
+            self._global_cancelled.discard(resource_id)
+        if granted and not cancelled:
+            self.log(f"SC global concedida a {member}", level="sc")
+            return True
+        if granted:
+            # o membro desistiu enquanto esperávamos: a SC global volta na hora
+            gp.release_cs(resource_id)
+        self._drop_holder(resource_id)
+        return False
+
+    def hr_release(self, member, resource_id=DEFAULT_RESOURCE):
+        self.meter.count_received("hr_release")
+        with self._global_cond:
+            if self._global_holders.get(resource_id) != member:
+                return False
+            if resource_id in self._global_pending:
+                # hr_acquire ainda espera o peer global: só marca a desistência, quem devolve é ele
+                self._global_cancelled.add(resource_id)
+                return True
+        self.global_peer.release_cs(resource_id)
+        self._drop_holder(resource_id)
+        return True
+
+    def _drop_holder(self, resource_id):
+        with self._global_cond:
+            self._global_holders.pop(resource_id, None)
+            self._global_cond.notify_all()
+
+    def _on_peer_removed(self, peer_name):
+        # chamado com active_lock: um membro que caiu segurando a SC global a devolve
+        with self._global_cond:
+            held = [rid for rid, m in self._global_holders.items() if m == peer_name]
+        for rid in held:
+            if not self._stop:
+                self._executor.submit(self.hr_release, peer_name, rid)
+
+    def elect(self, force=False):
+        """
+        Ativa o peer global se formos o coordenador do grupo (ou com force, ao atender
+        um hr_acquire). Sem membros conhecidos a eleição espera: todo peer recém-criado
+        se veria coordenador. Retorna o peer global ou None.
+        """
+        with self._global_lock:
+            if self.global_peer is not None or self._stop:
+                return self.global_peer
+            with self.active_lock:
+                alone = not self.active_peers
+            if not force and (alone or self.coordinator() != self.name):
+                return None
+            gp = Peer(f"{self.name}.global", ns_address=self.ns_address, verbose=self.verbose,
+                      access_time_limit=self.max_hold_time, reply_timeout=self.reply_timeout,
+                      runtime=self.runtime, serializer=self.proxies.pool.serializer)
+            uri = local_transport.host(self._pyroDaemon, gp)
+            tags = (group_tag(self.global_group),)
+            ns = get_ns(*self.ns_address) if self.ns_address else Pyro5.api.locate_ns()
+            register_peer(ns, gp.name, uri, tags)
+            gp.update_peers_from_nameserver(ns, tags)
+            gp.announce_join(uri)
+            self.global_peer = gp
+            self.log(f"Coordenador do grupo: peer global {gp.name} ativo.", level="hb")
+            return gp
+
+    def send_heartbeat(self):
+        super().send_heartbeat()
+        # eleição pela visão do heartbeat: o menor nome vivo assume o nível global
+        if self.global_peer is None and not self._stop:
+            self.elect()
+
+    def shutdown(self):
+        gp = self.global_peer
+        result = super().shutdown()
+        self._global_executor.shutdown(wait=False)
+        if gp is not None:
+            gp.shutdown()
+        return result
+
+    def info(self):
+        info = super().info()
+        info["algorithm"] = "hier"
+        info["coordinator"] = self.coordinator()
+        info["global_peer"] = self.global_peer.name if self.global_peer else None
+        with self._global_cond:
+            info["global_holders"] = dict(self._global_holders)
+        return info
@@ -0,0 +1,80 @@
+# k_mutex.py
+# k-exclusão mútua (Raymond, 1989): Ricart & Agrawala em que o pedido entra com
+# N-k respostas em vez de N-1, permitindo até k peers na SC ao mesmo tempo
+# (ex.: um pool de k licenças ou vagas de worker).
+import time
+import Pyro5.api
+from peer import WRITE, Peer
+
+
+@Pyro5.api.expose
+@Pyro5.api.behavior(instance_mode="single")
+class KMutexPeer(Peer):
+    """
+    Mesmo API do Peer; todos os peers do grupo devem usar o mesmo k.
+
+    As regras de adiamento são as do R&A: quem está na SC adia todo pedido e quem
+    espera adia os de menor prioridade. Com no máximo k-1 respostas faltando, ao
+    menos N-k peers confirmaram não estar na SC nem à frente na fila, o que limita
+    os detentores simultâneos a k. As respostas que chegam depois da entrada são
+    reconhecidas pelo timestamp e ignoradas.
+    """
+
+    # vagas indistintas: não há modo de leitura
+    cs_modes = (WRITE,)
+
+    def __init__(self, name, k=1, **kwargs):
+        if k < 1:
+            raise ValueError(f"k inválido: {k} (mínimo 1)")
+        self.k = k
+        self.slot_stats = {
+            "held_time": 0.0,       # soma do tempo de posse, todos os recursos
+            "missing_total": 0,     # respostas que ainda faltavam ao entrar
+            "missing_max": 0,
+        }
+        self._started = time.time()
+        super().__init__(name, **kwargs)
+
+    # ----------------------
+    # Ganchos do Peer
+    # ----------------------
+    def _enough_locked(self, res):
+        return res.enough(self.k)
+
+    def _enter_locked(self, res):
+        with self.active_lock:
+            missing = len(res.awaiting)
+        # cada resposta faltando pode ser de outro detentor: missing + 1 limita a ocupação vista na entrada
+        self.slot_stats["missing_total"] += missing
+        self.slot_stats["missing_max"] = max(self.slot_stats["missing_max"], missing)
+        super()._enter_locked(res)
+
+    def _release_locked(self, res, timestamp):
+        if res.entered is not None:
+            self.slot_stats["held_time"] += time.time() - res.entered
+        return super()._release_locked(res, timestamp)
+
+    def info(self):
+        info = super().info()
+        now = time.time()
+        with self.cs_lock:
+            held = self.slot_stats["held_time"] + sum(now - r.entered for r in self.resources.values()
+                                                      if r.entered is not None)
+            missing_total = self.slot_stats["missing_total"]
+            missing_max = self.slot_stats["missing_max"]
+        stats = info["stats"]
+        entries = stats["cs_entries"]
+        info["algorithm"] = "kmutex"
+        info["k"] = self.k
+        info["slots"] = {
+            "k": self.k,
+            "held_time": round(held, 3),
+            # fração das k vagas ocupada por este peer desde o início; a soma sobre
+            # os peers do grupo é a utilização total das vagas
+            "utilization": round(held / (self.k * (now - self._started)), 4),
+            "concurrency_bound_avg": round(missing_total / entries + 1, 3) if entries else 0.0,
+            "concurrency_bound_max": missing_max + 1 if entries else 0,
+            "wait_avg": stats["reply_wait_avg"],
+            "wait_max": stats["reply_wait_max"],
+        }
+        return info
@@ -0,0 +1,50 @@
+# local_transport.py
+# Atalho em processo para peers co-localizados: quando a URI de destino pertence a um
+# objeto hospedado neste mesmo processo, o ProxyPool chama o método direto no objeto,
+# sem serializar nem passar pelo socket de loopback. A semântica é a mesma das
+# chamadas Pyro: exceções chegam a quem chamou e chamadas oneway não bloqueiam.
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+_lock = threading.Lock()
+_objects = {}          # uri (str) -> objeto Pyro hospedado neste processo
+_oneway = None
+
+
+def host(daemon, obj):
+    """
+    Registra `obj` no daemon e no atalho local; retorna a URI. Vários peers podem
+    compartilhar o mesmo daemon (e porta), cada um com seu nome no NameServer.
+    """
+    uri = daemon.register(obj)
+    obj.uri = str(uri)
+    with _lock:
+        _objects[str(uri)] = obj
+    return uri
+
+
+def unhost(obj):
+    with _lock:
+        _objects.pop(str(obj.uri), None)
+
+
+def lookup(uri):
+    return _objects.get(str(uri))
+
+
+def call(obj, method, args, kwargs, oneway=False):
+    # os argumentos são passados por referência: o handler não deve alterar o que recebe
+    # e quem envia não deve alterar o que enviou (ex.: o token muda de dono na entrega)
+    fn = getattr(obj, method)
+    if not oneway:
+        return fn(*args, **kwargs)
+    _oneway_pool().submit(fn, *args, **kwargs)
+    return None
+
+
+def _oneway_pool():
+    global _oneway
+    with _lock:
+        if _oneway is None:
+            _oneway = ThreadPoolExecutor(max_workers=16, thread_name_prefix="local-oneway")
+        return _oneway
@@ -0,0 +1,273 @@
+# maekawa.py
+# Exclusão mútua de Maekawa com quóruns em grade: cada pedido precisa do voto de
+# ~2*sqrt(N) peers (linha + coluna na grade) em vez da permissão de todos os N-1.
+# Deadlocks entre votos são desfeitos com INQUIRE / RELINQUISH / FAILED.
+import heapq
+import math
+import time
+import Pyro5.api
+from event_feed import DEFER
+from peer import DEFAULT_RESOURCE, WANTED, WRITE, Peer, _Resource, _label
+
+
+def grid_quorum(members, name):
+    """
+    Quórum de `name` numa grade ceil(sqrt(N)) colunas, membros em ordem alfabética:
+    a linha e a coluna do peer. Dois quóruns quaisquer sempre se intersectam
+    (também quando a última linha está incompleta).
+    """
+    members = sorted(members)
+    cols = math.ceil(math.sqrt(len(members)))
+    row, col = divmod(members.index(name), cols)
+    return set(members[row * cols:(row + 1) * cols]) | set(members[col::cols])
+
+
+class _MaekawaResource(_Resource):
+    __slots__ = ("quorum", "got_failed", "inquiries", "voted", "queue", "inquired", "failed_sent")
+
+    def __init__(self, resource_id):
+        super().__init__(resource_id)
+        # papel de requisitante
+        self.quorum = set()
+        self.got_failed = False
+        self.inquiries = set()
+        # papel de árbitro
+        self.voted = None           # (ts, nome) do pedido que tem nosso voto
+        self.queue = []             # heap de (ts, nome) esperando voto
+        self.inquired = False
+        self.failed_sent = set()
+
+    def idle(self):
+        return super().idle() and self.voted is None and not self.queue
+
+
+@Pyro5.api.expose
+@Pyro5.api.behavior(instance_mode="single")
+class MaekawaPeer(Peer):
+    """
+    Mesmo API do Peer (request_cs/release_cs/request_cs_async/wait_cs), mas
+    cada peer também é árbitro: guarda, por recurso, um único voto e uma fila de pedidos.
+
+    Todos os peers do cluster devem rodar o mesmo algoritmo. O quórum é
+    calculado sobre a visão de membership no momento do pedido.
+    """
+
+    # cada árbitro tem um único voto por recurso: não há leitura compartilhada
+    cs_modes = (WRITE,)
+    wire_methods = Peer.wire_methods + ("mk_grant", "mk_inquire", "mk_failed",
+                                        "mk_request", "mk_relinquish", "mk_release")
+
+    def _new_resource(self, resource_id):
+        return _MaekawaResource(resource_id)
+
+    # ----------------------
+    # Ganchos do Peer
+    # ----------------------
+    def _request_targets(self, res):
+        members = set(self.active_peers) | {self.name}
+        res.quorum = grid_quorum(members, self.name)
+        res.got_failed = False
+        res.inquiries = set()
+        return {nm: (self.uri if nm == self.name else self.active_peers[nm]) for nm in res.quorum}
+
+    def _send_request(self, res, targets, timestamp):
+        with self.cs_lock:
+            for nm in targets:
+                self._post(nm, "mk_request", timestamp, res.id)
+
+    def _release_locked(self, res, timestamp):
+        # vale para saída da SC e para desistência: o árbitro libera o voto ou tira o pedido da fila
+        for nm in res.quorum:
+            self._post(nm, "mk_release", timestamp, res.id)
+        res.quorum = set()
+        res.inquiries = set()
+        return None
+
+    def _after_release(self, res, released):
+        pass
+
+    def _on_peer_removed(self, peer_name):
+        # chamado com active_lock; a limpeza do árbitro precisa de cs_lock, então vai para o executor
+        if not self._stop:
+            self._executor.submit(self._forget_peer, peer_name)
+
+    def _lost_permission_locked(self, res, peer_name):
+        # com active_lock: o voto de um árbitro removido não pode contar como concedido, porque
+        # ele pode estar com outro requisitante cujo quórum só cruza o nosso nesse árbitro.
+        # O pedido é abandonado (mk_release ao quórum antigo); o próximo usa a membership nova
+        if not self._stop:
+            self._executor.submit(self._abort_request, res, res.timestamp, peer_name)
+
+    def _abort_request(self, res, timestamp, peer_name):
+        with self.cs_lock:
+            if res.state != WANTED or res.timestamp != timestamp:
+                return
+            if res.timer is not None:
+                self.timers.cancel(res.timer)
+                res.timer = None
+            ticket, res.ticket = res.ticket, None
+            self.stats["cs_timeouts"] += 1
+            self._record_reply_wait(time.time() - res.since)
+            res.release()
+            released = self._release_locked(res, timestamp)
+            self._forget_if_idle(res)
+        self.log(f"Árbitro {peer_name} do quórum removido; pedido{_label(res.id)} abandonado.", level="error")
+        self._after_release(res, released)
+        ticket.finish(False)
+
+    # ----------------------
+    # Requisitante
+    # ----------------------
+    def _current(self, resource_id, ts):
+        # com cs_lock: o recurso, se a mensagem for sobre o pedido em andamento; senão None
+        res = self.resources.get(resource_id)
+        if res is not None and res.state == WANTED and ts == res.timestamp:
+            return res
+        return None
+
+    def mk_grant(self, voter, ts, resource_id=DEFAULT_RESOURCE):
+        self._mark_alive(voter)
+        self.meter.count_received("mk_grant")
+        with self.cs_lock:
+            res = self._current(resource_id, ts)
+            if res is None:
+                return True
+            self.log(f"Recebeu voto de {voter}", level="reply")
+            self._got_permission_locked(res, voter)
+        return True
+
+    def mk_inquire(self, voter, ts, resource_id=DEFAULT_RESOURCE):
+        self._mark_alive(voter)
+        self.meter.count_received("mk_inquire")
+        with self.cs_lock:
+            res = self._current(resource_id, ts)
+            if res is None:
+                # já na SC (ou pedido antigo): o voto volta com o RELEASE
+                return True
+            with self.active_lock:
+                complete = not res.awaiting
+            if complete:
+                return True
+            if res.got_failed:
+                self._relinquish(res, voter, ts)
+            else:
+                res.inquiries.add(voter)
+        return True
+
+    def mk_failed(self, voter, ts, resource_id=DEFAULT_RESOURCE):
+        self._mark_alive(voter)
+        self.meter.count_received("mk_failed")
+        with self.cs_lock:
+            res = self._current(resource_id, ts)
+            if res is None:
+                return True
+            res.got_failed = True
+            with self.active_lock:
+                complete = not res.awaiting
+            if not complete:
+                for inquirer in res.inquiries:
+                    self._relinquish(res, inquirer, ts)
+                res.inquiries = set()
+        return True
+
+    def _relinquish(self, res, voter, ts):
+        # com cs_lock: devolve o voto de `voter` e volta a esperar por ele
+        with self.active_lock:
+            res.awaiting.add(voter)
+        self.log(f"Devolvendo voto para {voter}", level="request")
+        self._post(voter, "mk_relinquish", ts, res.id)
+
+    # ----------------------
+    # Árbitro
+    # ----------------------
+    def mk_request(self, requester, ts, resource_id=DEFAULT_RESOURCE):
+        self._mark_alive(requester)
+        self.meter.count_received("mk_request")
+        self.bump_clock(remote_ts=ts)
+        req = (ts, requester)
+        with self.cs_lock:
+            res = self._resource(resource_id)
+            if res.voted is None:
+                self._vote(res, req)
+                return True
+            old_head = res.queue[0] if res.queue else None
+            heapq.heappush(res.queue, req)
+            self.feed.record(DEFER, self.clock, resource_id, requester)
+            if res.queue[0] == req and req < res.voted:
+                # pedido mais prioritário que o votado: pergunta se o voto pode voltar
+                if old_head is not None:
+                    self._fail(res, old_head)
+                if not res.inquired:
+                    res.inquired = True
+                    self._post(res.voted[1], "mk_inquire", res.voted[0], res.id)
+            else:
+                self._fail(res, req)
+        return True
+
+    def mk_relinquish(self, requester, ts, resource_id=DEFAULT_RESOURCE):
+        self._mark_alive(requester)
+        self.meter.count_received("mk_relinquish")
+        with self.cs_lock:
+            res = self.resources.get(resource_id)
+            if res is None or res.voted != (ts, requester):
+                return True
+            heapq.heappush(res.queue, res.voted)
+            self._vote(res, heapq.heappop(res.queue))
+        return True
+
+    def mk_release(self, requester, ts, resource_id=DEFAULT_RESOURCE):
+        self._mark_alive(requester)
+        self.meter.count_received("mk_release")
+        with self.cs_lock:
+            res = self.resources.get(resource_id)
+            if res is not None:
+                self._drop_request(res, (ts, requester))
+                self._forget_if_idle(res)
+        return True
+
+    def _forget_peer(self, peer_name):
+        with self.cs_lock:
+            for res in list(self.resources.values()):
+                reqs = [r for r in res.queue if r[1] == peer_name]
+                if res.voted is not None and res.voted[1] == peer_name:
+                    reqs.append(res.voted)
+                for req in reqs:
+                    self._drop_request(res, req)
+                self._forget_if_idle(res)
+
+    def _drop_request(self, res, req):
+        # com cs_lock
+        res.failed_sent.discard(req)
+        if res.voted == req:
+            res.voted = None
+            res.inquired = False
+            if res.queue:
+                self._vote(res, heapq.heappop(res.queue))
+        elif req in res.queue:
+            res.queue.remove(req)
+            heapq.heapify(res.queue)
+
+    def _vote(self, res, req):
+        # com cs_lock
+        res.voted = req
+        res.inquired = False
+        res.failed_sent.discard(req)
+        self._post(req[1], "mk_grant", req[0], res.id)
+
+    def _fail(self, res, req):
+        # com cs_lock
+        if req not in res.failed_sent:
+            res.failed_sent.add(req)
+            self._post(req[1], "mk_failed", req[0], res.id)
+
+    def info(self):
+        info = super().info()
+        with self.cs_lock:
+            res = self.resources.get(DEFAULT_RESOURCE)
+            info["algorithm"] = "maekawa"
+            info["quorum"] = sorted(res.quorum) if res else []
+            info["voted_for"] = res.voted[1] if res and res.voted else None
+            info["vote_queue"] = [nm for _, nm in sorted(res.queue)] if res else []
+            # votos concedidos em todos os recursos
+            info["votes"] = {rid: r.voted[1] for rid, r in self.resources.items() if r.voted}
+        return info
@@ -0,0 +1,129 @@
+# metrics.py
+# Instrumentação de baixo custo do Peer: histogramas de latência com baldes
+# logarítmicos fixos (uma busca binária e dois incrementos por amostra) e contadores
+# de mensagens por tipo. Peer.metrics() devolve o snapshot; com metrics_file ele é
+# também gravado periodicamente em JSON.
+import bisect
+import json
+import math
+import os
+import threading
+
+# limites superiores dos baldes, em segundos: 100us a ~100s, 8 baldes por década
+BUCKETS = tuple(round(1e-4 * 10 ** (i / 8), 7) for i in range(49))
+
+
+class Histogram:
+    """
+    Contagem de amostras por balde mais soma e máximo exatos. Percentis são
+    estimados pelo limite superior do balde (erro relativo de até ~33%).
+    Não é thread-safe por si: quem o usa é Metrics, sob o próprio lock.
+    """
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)   # último balde: acima de BUCKETS[-1]
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, pct):
+        if not self.count:
+            return 0.0
+        rank = pct / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return self.max
+
+    def summary(self):
+        # em milissegundos, como o benchmark.py
+        return {
+            "count": self.count,
+            "mean_ms": round(1000 * self.total / self.count, 3) if self.count else 0.0,
+            "p50_ms": round(1000 * self.percentile(50), 3),
+            "p90_ms": round(1000 * self.percentile(90), 3),
+            "p99_ms": round(1000 * self.percentile(99), 3),
+            "max_ms": round(1000 * self.max, 3),
+        }
+
+
+class Metrics:
+    """
+    Histogramas por fase (opcionalmente por peer) e contadores de mensagens
+    enviadas/recebidas por método. Todas as operações são O(log baldes) sob um lock curto.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hist = {}        # fase -> Histogram
+        self._per_peer = {}    # fase -> {peer: Histogram}
+        self.sent = {}
+        self.received = {}
+        self.sent_to = {}      # peer -> mensagens de protocolo enviadas (sem heartbeats)
+
+    def observe(self, phase, value, peer=None):
+        with self._lock:
+            hist = self._hist.get(phase)
+            if hist is None:
+                hist = self._hist[phase] = Histogram()
+            hist.observe(value)
+            if peer is not None:
+                peers = self._per_peer.setdefault(phase, {})
+                hist = peers.get(peer)
+                if hist is None:
+                    hist = peers[peer] = Histogram()
+                hist.observe(value)
+
+    def count_sent(self, method, peer=None):
+        with self._lock:
+            self.sent[method] = self.sent.get(method, 0) + 1
+            if peer is not None:
+                self.sent_to[peer] = self.sent_to.get(peer, 0) + 1
+
+    def count_received(self, method):
+        with self._lock:
+            self.received[method] = self.received.get(method, 0) + 1
+
+    def forget_peer(self, peer):
+        with self._lock:
+            for peers in self._per_peer.values():
+                peers.pop(peer, None)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "latency": {phase: h.summary() for phase, h in sorted(self._hist.items())},
+                "per_peer": {phase: {nm: h.summary() for nm, h in sorted(peers.items())}
+                             for phase, peers in sorted(self._per_peer.items())},
+                "msgs_sent": dict(self.sent),
+                "msgs_received": dict(self.received),
+                "msgs_sent_to": dict(self.sent_to),
+            }
+
+
+def percentile(values, pct):
+    # percentil exato por posto mais próximo (benchmark.py, cli.py load); lista vazia dá 0.0
+    if not values:
+        return 0.0
+    values = sorted(values)
+    rank = math.ceil(pct / 100.0 * len(values))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+def dump_json(path, data):
+    # escreve num arquivo temporário e renomeia: quem lê nunca vê um JSON pela metade
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
+    os.replace(tmp, path)
@@ -0,0 +1,113 @@
+# mutex_core.py
+# Núcleo do protocolo de Ricart & Agrawala (com leitura compartilhada e k vagas),
+# sem I/O, threads nem relógio de parede: relógio de Lamport, decisão de adiar e
+# contagem de respostas. peer.Peer (Pyro) e simulator.py (eventos discretos)
+# executam este mesmo código; quem o usa cuida de locks, envio e timers.
+
+# ----------------------
+# Estados Ricart & Agrawala
+# ----------------------
+RELEASED = "RELEASED"
+WANTED = "WANTED"
+HELD = "HELD"
+
+# Modos de acesso: leituras simultâneas não se excluem; só WRITE conflita
+READ = "READ"
+WRITE = "WRITE"
+CS_MODES = (READ, WRITE)
+
+# recurso usado quando request_cs/release_cs são chamados sem resource_id
+DEFAULT_RESOURCE = "default"
+
+
+def lamport_tick(clock, remote_ts=None):
+    # novo valor do relógio de Lamport: evento local ou recebimento de `remote_ts`
+    if remote_ts is None:
+        return clock + 1
+    return max(clock, remote_ts) + 1
+
+
+class CSState:
+    """
+    Estado de R&A de uma seção crítica nomeada, visto por um peer.
+    `awaiting` guarda quem ainda não respondeu ao pedido em andamento, `asked`
+    a quem ele foi enviado e `deferred` os pedidos (peer -> ts) cujo REPLY sai na liberação.
+    """
+    __slots__ = ("id", "state", "mode", "timestamp", "deferred", "awaiting", "asked", "sharers", "depth")
+
+    def __init__(self, resource_id):
+        self.id = resource_id
+        self.state = RELEASED
+        self.mode = WRITE
+        self.timestamp = None
+        self.deferred = {}         # peer -> ts do pedido cujo REPLY foi adiado (um por peer)
+        self.awaiting = set()      # peers cuja permissão ainda falta
+        self.asked = set()         # peers que receberam o pedido em andamento
+        self.sharers = 0           # leitores que já estavam na SC ao nos responder
+        self.depth = 0             # aquisições aninhadas (modo reentrante)
+
+    def idle(self):
+        return self.state == RELEASED and not self.deferred
+
+    def request(self, timestamp, mode, peers):
+        # passa a WANTED; `peers` são os nomes cuja permissão é necessária
+        self.state = WANTED
+        self.mode = mode
+        self.timestamp = timestamp
+        self.sharers = 0
+        self.awaiting = set(peers)
+        self.asked = set(peers)
+
+    def ask(self, peer):
+        """
+        `peer` entrou depois do nosso pedido e pediu com prioridade: também
+        precisamos da permissão dele. Retorna se ele deve receber nosso pedido.
+        """
+        if self.state != WANTED or peer in self.asked:
+            return False
+        self.asked.add(peer)
+        self.awaiting.add(peer)
+        return True
+
+    def on_request(self, me, sender, timestamp, mode):
+        """
+        REQUEST de `sender` recebido por `me`. Retorna (adiar, shared): se adiar,
+        o pedido fica em `deferred` até a liberação; shared indica que a resposta
+        imediata sai enquanto lemos o recurso.
+        """
+        held = self.state == HELD
+        # dois leitores nunca se adiam; com um escritor envolvido vale a regra de R&A
+        conflict = WRITE in (mode, self.mode)
+        defer = conflict and (held or (self.state == WANTED and
+                                       (timestamp, sender) >= (self.timestamp, me)))
+        if defer:
+            # um pedido repetido do mesmo peer substitui o anterior: no máximo um REPLY por peer
+            self.deferred[sender] = max(timestamp, self.deferred.get(sender, timestamp))
+        return defer, held and not conflict
+
+    def on_reply(self, sender, timestamp=None, shared=False):
+        # conta o REPLY se ele for do pedido em andamento; REPLY atrasado de um pedido anterior é ignorado
+        if self.state != WANTED or timestamp not in (None, self.timestamp):
+            return False
+        if shared:
+            self.sharers += 1
+        self.awaiting.discard(sender)
+        return True
+
+    def enough(self, k=1):
+        # com no máximo k-1 permissões faltando o pedido pode entrar (k=1: todas)
+        return len(self.awaiting) < k
+
+    def enter(self):
+        self.state = HELD
+        self.depth = 1
+
+    def release(self):
+        # saída da SC ou desistência do pedido; os REPLYs adiados saem com take_deferred
+        self.state = RELEASED
+        self.timestamp = None
+        self.depth = 0
+
+    def take_deferred(self):
+        deferred, self.deferred = self.deferred, {}
+        return deferred
@@ -39,3 +39,98 @@ def get_or_start_nameserver(host="localhost", port=9090, try_connect_timeout=2.0
 
     raise RuntimeError("Não foi possível localizar ou iniciar o Pyro NameServer.")
 
+
+# ----------------------
+# Serviço de membership
+# ----------------------
+# Peers se registram com esta tag de metadados; a listagem é filtrada no próprio
+# NameServer (yplookup), sem trazer registros que não são peers.
+PEER_TAG = "mutex.peer"
+
+_ns_cache = threading.local()
+
+def get_ns(host="localhost", port=9090):
+    """
+    Retorna um proxy para o NameServer reaproveitado pela thread atual
+    (proxies Pyro não podem ser compartilhados entre threads). Só faz o
+    locate_ns na primeira vez ou depois de invalidate_ns.
+    """
+    cache = getattr(_ns_cache, "proxies", None)
+    if cache is None:
+        cache = _ns_cache.proxies = {}
+    ns = cache.get((host, port))
+    if ns is None:
+        ns = cache[(host, port)] = Pyro5.api.locate_ns(host=host, port=port)
+    return ns
+
+def invalidate_ns(host="localhost", port=9090):
+    cache = getattr(_ns_cache, "proxies", None)
+    if cache:
+        ns = cache.pop((host, port), None)
+        if ns is not None:
+            try:
+                ns._pyroRelease()
+            except Exception:
+                pass
+
+def group_tag(group):
+    """Tag de metadata de um grupo de peers; cada grupo é um cluster de exclusão mútua separado."""
+    return f"{PEER_TAG}.group:{group}"
+
+def register_peer(ns, name, uri, tags=()):
+    """
+    Registra o peer no NameServer com a tag PEER_TAG (mais `tags` extras).
+    Se já existir um registro com o mesmo nome, ele é sobrescrito.
+    """
+    ns.register(name, uri, metadata={PEER_TAG, *tags})
+
+def list_peers(ns, tags=()):
+    """Retorna {nome: uri} apenas dos registros marcados como peer (e com todas as `tags`)."""
+    found = ns.yplookup(meta_all={PEER_TAG, *tags}, return_metadata=False)
+    return {nm: str(uri) for nm, uri in found.items()}
+
+class MembershipWatcher:
+    """
+    Consulta lenta de fallback ao NameServer. Mudanças normais de membership
+    chegam empurradas pelos próprios peers (Peer.membership_update); esta
+    thread só corrige o que se perdeu (ex.: dois peers entrando ao mesmo tempo
+    ou um peer que morreu sem se desregistrar). Chama on_snapshot({nome: uri}).
+    Com `runtime` (async_runtime.AsyncRuntime) a consulta é agendada no event loop
+    em vez de ocupar uma thread.
+    """
+
+    def __init__(self, on_snapshot, host="localhost", port=9090, interval=10.0, tags=(), runtime=None):
+        self.on_snapshot = on_snapshot
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self.tags = tuple(tags)
+        self.runtime = runtime
+        self._task = None
+        self._stop = threading.Event()
+
+    def poll(self):
+        try:
+            names = list_peers(get_ns(self.host, self.port), self.tags)
+        except Exception as ex:
+            invalidate_ns(self.host, self.port)
+            print("[membership] erro consultando NameServer:", ex)
+            return False
+        self.on_snapshot(names)
+        return True
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.poll()
+
+    def start(self):
+        if self.runtime is not None:
+            self._task = self.runtime.every(self.interval, self.poll, first=self.interval)
+            return
+        t = threading.Thread(target=self._loop, daemon=True)
+        t.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
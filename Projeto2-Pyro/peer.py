@@ -1,7 +1,19 @@
+import heapq
+import itertools
+import random
 import threading
 import time
 import Pyro5.api
-from collections import deque
+import local_transport
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from event_feed import DEFER, ENTER, EXIT, REMOVE, REPLY, REQUEST, EventFeed
+from failure_detector import PhiAccrualDetector
+from fault_injection import FaultInjector
+from metrics import Metrics, dump_json
+from mutex_core import CS_MODES, DEFAULT_RESOURCE, HELD, READ, RELEASED, WANTED, WRITE, CSState, lamport_tick
+from nameserver_helper import get_ns, list_peers
+from proxy_pool import ProxyPool
 
 # ----------------------
 # Códigos ANSI de cores
@@ -13,39 +25,237 @@ YELLOW = "\033[93m"
 BLUE = "\033[94m"
 CYAN = "\033[96m"
 
+MAX_FINISHED_TICKETS = 256
+RTT_ALPHA = 0.125
+RTT_BETA = 0.25
+
+# Modos de heartbeat: "all" sonda todo peer silencioso; "gossip" sonda só
+# `heartbeat_fanout` peers aleatórios por rodada e espalha a visão de vivacidade (estilo SWIM)
+HB_MODES = ("all", "gossip")
+
+
+def _label(resource_id):
+    # sufixo dos logs; o recurso padrão mantém as mensagens de antes
+    return "" if resource_id == DEFAULT_RESOURCE else f" [{resource_id}]"
+
+
+class _Ticket:
+    # pedido assíncrono de SC; o resultado fica em `granted` quando `done` é sinalizado
+    __slots__ = ("id", "done", "granted")
+
+    def __init__(self, ticket_id):
+        self.id = ticket_id
+        self.done = threading.Event()
+        self.granted = None
+
+    def finish(self, granted):
+        self.granted = granted
+        self.done.set()
+
+
+class _Resource(CSState):
+    """
+    Estado de uma seção crítica nomeada: o do protocolo (CSState) mais timers e
+    tickets. Criado sob demanda e descartado quando ocioso, para que milhares de
+    recursos caibam na memória. Protegido por cs_lock; `awaiting` também é
+    alterado por _remove_peer, sob active_lock.
+    """
+    __slots__ = ("since", "timer", "ticket", "entered")
+
+    def __init__(self, resource_id):
+        super().__init__(resource_id)
+        self.since = None          # início do pedido em andamento (métrica de espera)
+        self.timer = None          # prazo das respostas (WANTED) ou da posse (HELD)
+        self.ticket = None
+        self.entered = None        # instante da entrada na SC (limite max_hold_time)
+
+    def idle(self):
+        return super().idle() and self.ticket is None
+
+
+class _TimerQueue:
+    """
+    Uma única thread para os timers de todos os recursos; um threading.Timer
+    por SC mantida seria uma thread por recurso. Cada callback roda numa thread
+    própria e curta, para não atrasar os demais timers.
+    """
+
+    def __init__(self, name):
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name=f"{name}-timers", daemon=True)
+        self._thread.start()
+
+    def remaining(self, entry):
+        return max(entry[0] - time.monotonic(), 0.0)
+
+    def schedule(self, delay, fn, *args):
+        entry = [time.monotonic() + delay, next(self._seq), fn, args]
+        with self._cond:
+            heapq.heappush(self._heap, entry)
+            if self._heap[0] is entry:
+                self._cond.notify()
+        return entry
+
+    def cancel(self, entry):
+        # cancelamento preguiçoso: a entrada é descartada quando chegar ao topo
+        entry[2] = None
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    now = time.monotonic()
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    self._cond.wait(self._heap[0][0] - now if self._heap else None)
+                if self._stopped:
+                    return
+                _, _, fn, args = heapq.heappop(self._heap)
+            if fn is not None:
+                threading.Thread(target=fn, args=args, daemon=True).start()
+
+
 @Pyro5.api.expose
 @Pyro5.api.behavior(instance_mode="single")
 class Peer:
-    def __init__(self, name, access_time_limit=10.0, heartbeat_interval=1.0, heartbeat_timeout=3.0, reply_timeout=25.0):
+    # modos de acesso suportados pelo algoritmo
+    cs_modes = CS_MODES
+    # mensagens aceitas por deliver(); na rede vão pelo índice nesta tupla, que deve
+    # ser a mesma em todo o cluster (subclasses acrescentam as suas no fim)
+    wire_methods = ("receive_request", "receive_reply", "heartbeat", "heartbeat_ack")
+    # tráfego de fundo, fora da contagem de mensagens de protocolo por destino
+    background_methods = ("heartbeat", "heartbeat_ack", "membership_update", "deliver")
+
+    def __init__(self, name, access_time_limit=10.0, heartbeat_interval=1.0, heartbeat_timeout=3.0, reply_timeout=25.0,
+                 send_timeout=5.0, max_fanout_workers=16,
+                 heartbeat_silence=0.5, heartbeat_mode="all", heartbeat_fanout=3,
+                 phi_threshold=8.0, min_rto=1.0, ns_address=None, max_hold_time=60.0, reentrant=False,
+                 verbose=True, metrics_file=None, metrics_interval=10.0, runtime=None, serializer=None,
+                 event_capacity=1024):
+        if heartbeat_mode not in HB_MODES:
+            raise ValueError(f"heartbeat_mode inválido: {heartbeat_mode} (use {HB_MODES})")
         self.name = name
+        # verbose=False silencia o log (ex.: benchmark com muitos peers no mesmo processo)
+        self.verbose = verbose
+        self.uri = None
+        # (host, port) do NameServer; None usa a localização padrão do Pyro
+        self.ns_address = ns_address
         self.clock = 0
-        self.requesting = False
-        self.request_timestamp = None
-        self.deferred_replies = deque()
-        self.replies_received = set()
+        self.clock_lock = threading.Lock()
+        # resource_id -> _Resource; só recursos em uso (ver _forget_if_idle)
+        self.resources = {}
 
         self.active_peers = {}
         self.active_lock = threading.Lock()
 
         self.last_heartbeat = {}
+        self.hb_rtt = {}
+        self.hb_rttvar = {}
+        # o pool passa pela camada de injeção de falhas (inerte até set_network_faults/set_partition)
+        # serializer: serpent (padrão do Pyro), marshal, json ou msgpack (se instalado)
+        self.proxies = FaultInjector(ProxyPool(serializer=serializer))
+        # send_timeout é o teto; o prazo efetivo de cada envio segue o RTO medido (_rto)
+        self.send_timeout = send_timeout
+        self.min_rto = min_rto
+        # runtime=None: threads próprias (heartbeat, timers, executor); com um
+        # async_runtime.AsyncRuntime tudo isso roda no event loop e nos pools do processo
+        self.runtime = runtime
+        if runtime is None:
+            self._executor = ThreadPoolExecutor(max_workers=max_fanout_workers,
+                                                thread_name_prefix=f"{name}-fanout")
+        else:
+            self._executor = runtime.executor()
+        # filas de saída FIFO por destino, usadas por _post
+        self._outbox = {}
+        self._outbox_lock = threading.Lock()
+        # ids compactos dos remetentes em deliver(): os que atribuímos (nome <-> id) e,
+        # por destino, o id que ele nos atribuiu
+        self._wire_codes = {m: i for i, m in enumerate(self.wire_methods)}
+        self._wire_ids = {}
+        self._wire_names = {}
+        self._wire_seq = itertools.count(1)
+        self._wire_ids_at = {}
+        self._wire_lock = threading.Lock()
         self.hb_interval = heartbeat_interval
         self.hb_timeout = heartbeat_timeout
+        # heartbeat explícito só para peers em silêncio há mais de hb_silence * hb_timeout
+        self.hb_silence = heartbeat_silence
+        self.hb_mode = heartbeat_mode
+        self.hb_fanout = heartbeat_fanout
+        # intervalo esperado entre notícias de um peer ocioso: silêncio tolerado + granularidade da thread
+        self.detector = PhiAccrualDetector(
+            threshold=phi_threshold,
+            min_interval=heartbeat_interval / 2,
+            min_std=heartbeat_interval / 2,
+            first_interval=heartbeat_silence * heartbeat_timeout + heartbeat_interval / 2,
+        )
 
         self.access_time_limit = access_time_limit
+        # teto da posse com renew_cs, contado da entrada; deve ser o mesmo em todo o cluster
+        self.max_hold_time = max(max_hold_time, access_time_limit)
+        # reentrante: request_cs de um recurso já mantido só aumenta a profundidade
+        self.reentrant = reentrant
         self.reply_timeout = reply_timeout
 
-        self.in_cs = False
+        # cs_lock protege apenas transições de estado curtas; nunca é mantido durante I/O
         self.cs_lock = threading.Lock()
-        self.cs_timer = None
+        # prazos de resposta e de posse de todos os recursos
+        self.timers = _TimerQueue(name) if runtime is None else runtime.timers()
+        self._tickets = OrderedDict()
+        self._ticket_ids = itertools.count(1)
+
+        self.stats = {
+            "cs_entries": 0,
+            "cs_timeouts": 0,
+            "reply_wait_last": 0.0,
+            "reply_wait_max": 0.0,
+            "reply_wait_total": 0.0,
+            "hb_sent": 0,
+            "hb_skipped": 0,
+            "hb_acks": 0,
+            "msgs_sent": 0,
+            "read_entries": 0,
+            "readers_last": 0,
+            "readers_max": 0,
+            "readers_total": 0,
+            "renewals": 0,
+            "renewals_refused": 0,
+            "reentries": 0,
+            "lease_expired": 0,
+            "deferred_sent": 0,
+            "deferred_failed": 0,
+            "deferred_flushes": 0,
+            "deferred_depth_last": 0,
+            "deferred_depth_max": 0,
+            "deferred_depth_total": 0,
+        }
+        # histogramas por fase e mensagens por tipo (ver metrics()); com metrics_file o
+        # snapshot é gravado a cada metrics_interval segundos
+        self.meter = Metrics()
+        self.metrics_file = metrics_file
+        self.metrics_interval = metrics_interval
+        # últimos eventos do protocolo para o cli.py watch (ver events()); 0 desliga
+        self.feed = EventFeed(event_capacity)
 
         self._stop = False
         self.threads = []
+        self._periodic = []
         self._start_background_threads()
 
     # ----------------------
     # Logger colorido
     # ----------------------
     def log(self, msg, level="info"):
+        if not self.verbose:
+            return
         color = RESET
         if level == "request":
             color = BLUE
@@ -63,163 +273,629 @@ class Peer:
     # Lamport clock
     # ----------------------
     def bump_clock(self, remote_ts=None):
-        if remote_ts is None:
-            self.clock += 1
+        with self.clock_lock:
+            self.clock = lamport_tick(self.clock, remote_ts)
+            return self.clock
+
+    # ----------------------
+    # Comunicação com outros peers
+    # ----------------------
+    def _call(self, peer_name, method, *args, uri=None, timeout=None, oneway=False, **kwargs):
+        if uri is None:
+            uri = self.active_peers.get(peer_name)
+            if uri is None:
+                raise KeyError(f"peer desconhecido: {peer_name}")
+        self.stats["msgs_sent"] += 1
+        self._count_sent(method, peer_name)
+        result = self.proxies.call(peer_name, uri, method, *args, timeout=timeout, oneway=oneway, **kwargs)
+        if not oneway:
+            # resposta recebida: vale como heartbeat do peer
+            self._mark_alive(peer_name)
+        return result
+
+    def _count_sent(self, method, peer_name):
+        # deliver conta as mensagens do lote, não a chamada
+        self.meter.count_sent(method, None if method in self.background_methods else peer_name)
+
+    def _post(self, peer_name, method, *args, **kwargs):
+        """
+        Envio assíncrono de mensagem de protocolo preservando a ordem por destino
+        (algoritmos como Maekawa supõem canais FIFO). O remetente (self.name) é o
+        primeiro argumento do handler e não vai em `args`. As mensagens que se
+        acumulam para um destino seguem juntas numa só chamada deliver(); as para o
+        próprio peer são entregues localmente. Pode ser chamado com locks adquiridos.
+        """
+        with self._outbox_lock:
+            box = self._outbox.get(peer_name)
+            if box is not None:
+                # já existe uma tarefa drenando este destino: ela levará a mensagem
+                box.append((method, args, kwargs))
+                return
+            self._outbox[peer_name] = deque([(method, args, kwargs)])
+        try:
+            self._executor.submit(self._drain_outbox, peer_name)
+        except RuntimeError:
+            # executor já encerrado (shutdown)
+            pass
+
+    def _drain_outbox(self, peer_name):
+        while True:
+            with self._outbox_lock:
+                box = self._outbox[peer_name]
+                if not box:
+                    del self._outbox[peer_name]
+                    return
+                batch = list(box)
+                box.clear()
+            if peer_name == self.name:
+                for method, args, kwargs in batch:
+                    try:
+                        getattr(self, method)(self.name, *args, **kwargs)
+                    except Exception as e:
+                        self.log(f"Falha entregando {method} localmente: {e}", level="error")
+                continue
+            try:
+                # chamada bidirecional: o próximo lote só sai depois que este foi processado,
+                # o que garante a ordem mesmo com o daemon remoto multi-thread
+                self._deliver(peer_name, batch)
+            except Exception as e:
+                methods = sorted({method for method, _, _ in batch})
+                self.log(f"Falha enviando {len(batch)} mensagem(ns) {methods} para {peer_name}: {e}",
+                         level="error")
+
+    def _deliver(self, peer_name, batch):
+        # [código, args] (ou [código, args, kwargs]) por mensagem; o remetente vai uma vez só,
+        # como o id compacto que o destino nos deu ou, até lá, pelo nome
+        messages = [[self._wire_codes[method], list(args), kwargs] if kwargs else
+                    [self._wire_codes[method], list(args)] for method, args, kwargs in batch]
+        self.stats["msgs_sent"] += len(batch) - 1
+        for method, _, _ in batch:
+            self._count_sent(method, peer_name)
+        with self._wire_lock:
+            sender = self._wire_ids_at.get(peer_name, self.name)
+        timeout = self._rto(peer_name)
+        peer_id = self._call(peer_name, "deliver", sender, messages, timeout=timeout)
+        if peer_id is None:
+            # o destino não conhece o id (reiniciou ou nos removeu): o lote não foi
+            # entregue e vai de novo com o nome, que também renova o id
+            peer_id = self._call(peer_name, "deliver", self.name, messages, timeout=timeout)
+        with self._wire_lock:
+            self._wire_ids_at[peer_name] = peer_id
+
+    def deliver(self, sender, messages):
+        """
+        Entrada em lote das mensagens de _post, processadas em ordem. `sender` é o id
+        compacto que atribuímos ao remetente ou o nome dele. Retorna o id a usar nos
+        próximos lotes; None quando o id é desconhecido, caso em que nada foi
+        processado e o remetente reenvia com o nome.
+        """
+        if isinstance(sender, str):
+            name, peer_id = sender, self._wire_id(sender)
         else:
-            self.clock = max(self.clock, remote_ts) + 1
-        return self.clock
+            with self._wire_lock:
+                name, peer_id = self._wire_names.get(sender), sender
+            if name is None:
+                return None
+        self.meter.count_received("deliver")
+        for msg in messages:
+            method = self.wire_methods[msg[0]]
+            try:
+                getattr(self, method)(name, *msg[1], **(msg[2] if len(msg) > 2 else {}))
+            except Exception as e:
+                self.log(f"Falha processando {method} de {name}: {e}", level="error")
+        return peer_id
+
+    def _wire_id(self, peer_name):
+        # id compacto de `peer_name` nos lotes que ele nos envia; ids nunca são reaproveitados
+        with self._wire_lock:
+            peer_id = self._wire_ids.get(peer_name)
+            if peer_id is None:
+                peer_id = self._wire_ids[peer_name] = next(self._wire_seq)
+                self._wire_names[peer_id] = peer_name
+            return peer_id
+
+    def _mark_alive(self, peer_name, when=None):
+        when = time.time() if when is None else when
+        if when > self.last_heartbeat.get(peer_name, 0):
+            self.last_heartbeat[peer_name] = when
+            self.detector.heartbeat(peer_name, when)
+
+    def _rto(self, peer_name):
+        # retransmission timeout no estilo TCP (RFC 6298), limitado a [min_rto, send_timeout]
+        srtt = self.hb_rtt.get(peer_name)
+        if srtt is None:
+            return self.send_timeout
+        rto = srtt + 4 * self.hb_rttvar.get(peer_name, srtt / 2)
+        return min(max(rto, self.min_rto), self.send_timeout)
+
+    def _fanout(self, targets, method, *args, timeout=None, oneway=False, each=None, **kwargs):
+        """
+        Envia a mesma chamada a vários peers em paralelo (executor limitado).
+        `targets` é um dict nome -> uri; `each` (opcional) dá kwargs próprios de cada peer.
+        Retorna dict nome -> exceção (ou None se ok);
+        peers que não responderam até o prazo aparecem com TimeoutError.
+        """
+        return self._gather(targets, method, *args, timeout=timeout, oneway=oneway, each=each, **kwargs)[1]
 
-    def update_peers_from_nameserver(self, ns):
+    def _gather(self, targets, method, *args, timeout=None, oneway=False, each=None, **kwargs):
+        # como _fanout, mas também retorna os resultados: ({nome: resultado}, {nome: exceção ou None})
+        futures = {}
+        for peer_name, uri in targets.items():
+            extra = each[peer_name] if each else {}
+            fut = self._executor.submit(self._call, peer_name, method, *args,
+                                        uri=uri, timeout=timeout, oneway=oneway, **kwargs, **extra)
+            futures[fut] = peer_name
+        # cada chamada já tem seu próprio timeout; a folga cobre a espera na fila do executor
+        deadline = None if timeout is None else timeout * 2
+        done, _ = wait(futures, timeout=deadline)
+        results, errors = {}, {}
+        for fut, peer_name in futures.items():
+            if fut not in done:
+                errors[peer_name] = TimeoutError(f"{method} sem resposta em {deadline}s")
+            else:
+                errors[peer_name] = fut.exception()
+                if errors[peer_name] is None:
+                    results[peer_name] = fut.result()
+        return results, errors
+
+    def _remove_peer(self, peer_name):
+        # deve ser chamado com active_lock adquirido
+        if self.active_peers.pop(peer_name, None) is not None:
+            self.feed.record(REMOVE, self.clock, None, peer_name)
+        self.last_heartbeat.pop(peer_name, None)
+        self.hb_rtt.pop(peer_name, None)
+        self.hb_rttvar.pop(peer_name, None)
+        self.detector.remove(peer_name)
+        self.proxies.evict(peer_name)
+        self.meter.forget_peer(peer_name)
+        with self._wire_lock:
+            self._wire_names.pop(self._wire_ids.pop(peer_name, None), None)
+            self._wire_ids_at.pop(peer_name, None)
+        self._on_peer_removed(peer_name)
+        for res in list(self.resources.values()):
+            if peer_name in res.awaiting:
+                self._lost_permission_locked(res, peer_name)
+
+    # ----------------------
+    # Membership
+    # ----------------------
+    def update_peers_from_nameserver(self, ns, tags=()):
         try:
-            names = ns.list(prefix="")
-            with self.active_lock:
-                for nm, uri in names.items():
-                    if nm == self.name or nm == "Pyro.NameServer":
-                        continue
-                    if nm not in self.active_peers:
-                        self.log(f"Descoberto peer: {nm}", level="hb")
-                        self.active_peers[nm] = uri
-                        self.last_heartbeat[nm] = time.time()
-                for nm in list(self.active_peers.keys()):
-                    if nm not in names:
-                        self.log(f"Peer removido do NS: {nm}", level="error")
-                        self.active_peers.pop(nm, None)
-                        self.last_heartbeat.pop(nm, None)
-            return True
+            names = list_peers(ns, tags)
         except Exception as e:
             self.log(f"Falha ao consultar NS: {e}", level="error")
             return False
+        self.sync_membership(names)
+        return True
+
+    def sync_membership(self, names):
+        # reconcilia com uma listagem completa do NS (fallback lento)
+        with self.active_lock:
+            added = {nm: uri for nm, uri in names.items() if self.active_peers.get(nm) != uri}
+            removed = [nm for nm in self.active_peers if nm not in names]
+        if added or removed:
+            self.membership_update(added, removed)
+
+    def membership_update(self, added, removed):
+        """Aplica um delta de membership ({nome: uri} entrou, [nome] saiu), empurrado por outro peer ou pelo NS."""
+        self.meter.count_received("membership_update")
+        with self.active_lock:
+            for nm, uri in added.items():
+                uri = str(uri)
+                if nm == self.name or self.active_peers.get(nm) == uri:
+                    continue
+                if nm in self.active_peers:
+                    # peer reiniciado com outra URI: descarta o estado da encarnação anterior
+                    self._remove_peer(nm)
+                self.log(f"Descoberto peer: {nm}", level="hb")
+                self.active_peers[nm] = uri
+                self._wire_id(nm)
+                self._mark_alive(nm)
+            for nm in removed:
+                if nm in self.active_peers:
+                    self.log(f"Peer saiu: {nm}", level="error")
+                    self._remove_peer(nm)
+        return True
+
+    def announce_join(self, uri):
+        # avisa os peers já conhecidos; eles não precisam esperar o próximo poll do NS
+        self.uri = str(uri)
+        self._announce({self.name: self.uri}, [])
+
+    def _announce(self, added, removed):
+        with self.active_lock:
+            targets = dict(self.active_peers)
+        if targets:
+            self._fanout(targets, "membership_update", added, removed, timeout=self.send_timeout, oneway=True)
 
     # ----------------------
     # Ricart & Agrawala
     # ----------------------
-    def request_cs(self):
+    # Cada resource_id é uma seção crítica independente, com timestamp, fila de
+    # REPLYs adiados e timer de posse próprios. O pedido não ocupa thread: a entrada
+    # acontece na chegada da última permissão e a desistência num timer.
+    def request_cs(self, resource_id=DEFAULT_RESOURCE, mode=WRITE):
+        return self.wait_cs(self.request_cs_async(resource_id, mode))
+
+    def request_cs_async(self, resource_id=DEFAULT_RESOURCE, mode=WRITE):
+        """
+        Inicia o pedido da SC `resource_id` sem bloquear e retorna o id de um ticket.
+        O resultado é obtido com wait_cs(ticket). Cada posse pertence a um só ticket:
+        se já houver um pedido pendente para o recurso, o novo ticket termina com False.
+        mode=READ permite outros leitores na SC ao mesmo tempo; WRITE é exclusivo.
+        """
+        if mode not in self.cs_modes:
+            raise ValueError(f"modo inválido: {mode} (use {self.cs_modes})")
         with self.cs_lock:
-            if self.in_cs:
-                self.log("Já está na seção crítica.", level="error")
-                return False
-            self.bump_clock()
-            self.request_timestamp = self.clock
-            self.requesting = True
+            res = self._resource(resource_id)
+            ticket = self._new_ticket()
+            if res.state == WANTED:
+                # outro chamador (ex.: outra sessão do cli.py) já espera por este recurso
+                self.log(f"Já há um pedido pendente da SC{_label(resource_id)}.", level="error")
+                ticket.finish(False)
+                return ticket.id
+            if res.state == HELD:
+                if self.reentrant and mode in (res.mode, READ):
+                    # aquisição aninhada: nenhuma mensagem, a posse e o prazo continuam os mesmos
+                    res.depth += 1
+                    self.stats["reentries"] += 1
+                    ticket.finish(True)
+                    return ticket.id
+                self.log(f"Já está na seção crítica{_label(resource_id)}.", level="error")
+                ticket.finish(False)
+                return ticket.id
+            timestamp = self.bump_clock()
+            res.since = time.time()
+            res.ticket = ticket
             with self.active_lock:
-                targets = list(self.active_peers.keys())
-            self.replies_received = set()
-            self.log(f"Solicitando SC (ts={self.request_timestamp}) para {targets}", level="request")
+                targets = self._request_targets(res)
+                res.request(timestamp, mode, targets)
+                complete = self._enough_locked(res)
+            self.feed.record(REQUEST, timestamp, resource_id, mode)
+            if complete:
+                self._enter_locked(res)
+                return ticket.id
+            res.timer = self.timers.schedule(self.reply_timeout, self._reply_deadline, res, timestamp)
 
-            for peer_name in targets:
-                uri = self.active_peers.get(peer_name)
-                if not uri:
-                    continue
-                try:
-                    with Pyro5.api.Proxy(uri) as proxy:
-                        proxy._pyroTimeout = self.reply_timeout
-                        proxy.receive_request(self.name, self.request_timestamp)
-                except Exception as e:
-                    self.log(f"Falha ao enviar REQUEST para {peer_name}: {e}", level="error")
-
-            deadline = time.time() + self.reply_timeout
-            while time.time() < deadline:
-                with self.active_lock:
-                    needed = set(self.active_peers.keys()) - self.replies_received
-                if not needed:
-                    break
-                time.sleep(0.05)
+        self.log(f"Solicitando SC{_label(resource_id)} (ts={timestamp}, {mode}) para {list(targets)}",
+                 level="request")
+        self._send_request(res, targets, timestamp)
+        return ticket.id
 
+    def wait_cs(self, ticket_id, timeout=None):
+        """
+        Espera o resultado de um ticket de request_cs_async.
+        Retorna True (entrou na SC), False (falhou) ou None se ainda pendente após `timeout`.
+        """
+        with self.cs_lock:
+            ticket = self._tickets.get(ticket_id)
+        if ticket is None:
+            self.log(f"Ticket desconhecido: {ticket_id}", level="error")
+            return False
+        if not ticket.done.wait(timeout):
+            return None
+        with self.cs_lock:
+            self._tickets.pop(ticket_id, None)
+        return ticket.granted
+
+    def _new_ticket(self):
+        # deve ser chamado com cs_lock adquirido
+        ticket = _Ticket(next(self._ticket_ids))
+        self._tickets[ticket.id] = ticket
+        # descarta tickets terminados que ninguém esperou
+        while len(self._tickets) > MAX_FINISHED_TICKETS:
+            oldest = next(iter(self._tickets.values()))
+            if not oldest.done.is_set():
+                break
+            self._tickets.popitem(last=False)
+        return ticket
+
+    def _resource(self, resource_id):
+        # com cs_lock: estado do recurso, criado sob demanda
+        res = self.resources.get(resource_id)
+        if res is None:
+            res = self.resources[resource_id] = self._new_resource(resource_id)
+        return res
+
+    def _new_resource(self, resource_id):
+        return _Resource(resource_id)
+
+    def _forget_if_idle(self, res):
+        # com cs_lock
+        if res.idle() and self.resources.get(res.id) is res:
+            del self.resources[res.id]
+
+    # Ganchos do algoritmo. Peer implementa Ricart & Agrawala; outros modos
+    # (ex.: maekawa.MaekawaPeer) sobrescrevem estes métodos e reaproveitam
+    # a máquina de estados, os tickets, a espera por respostas e os timers.
+    def _request_targets(self, res):
+        # com cs_lock e active_lock: peers cuja permissão é necessária (nome -> uri)
+        return dict(self.active_peers)
+
+    def _send_request(self, res, targets, timestamp):
+        # fora de locks; não deve bloquear
+        for peer_name in targets:
+            self._post(peer_name, "receive_request", timestamp, res.id, res.mode)
+
+    def _release_locked(self, res, timestamp):
+        # com cs_lock adquirido, ao sair da SC ou desistir do pedido `timestamp`; o retorno vai para _after_release
+        return self._take_deferred(res)
+
+    def _after_release(self, res, deferred):
+        # fora de qualquer lock: mensagens de liberação
+        self._send_deferred_replies(res.id, deferred)
+
+    def _on_peer_removed(self, peer_name):
+        # com active_lock adquirido
+        pass
+
+    def _lost_permission_locked(self, res, peer_name):
+        # com active_lock: `peer_name`, de quem ainda esperávamos permissão, foi removido.
+        # Em R&A um peer que saiu não disputa mais a SC: a ausência dele conta como REPLY
+        res.awaiting.discard(peer_name)
+        if self._enough_locked(res) and not self._stop:
+            # a entrada precisa de cs_lock, que não pode ser pego depois de active_lock
+            self._executor.submit(self._check_granted, res, res.timestamp)
+
+    def _enough_locked(self, res):
+        # com active_lock: as permissões já recebidas bastam para entrar?
+        return res.enough()
+
+    def _got_permission_locked(self, res, peer_name):
+        # com cs_lock, para uma permissão do pedido em andamento de `res`
+        self.meter.observe("permission", time.time() - res.since, peer_name)
+        self.feed.record(REPLY, self.clock, res.id, peer_name)
+        with self.active_lock:
+            res.awaiting.discard(peer_name)
+            complete = self._enough_locked(res)
+        if complete and res.state == WANTED:
+            self._enter_locked(res)
+
+    def _check_granted(self, res, timestamp):
+        # _remove_peer levou a última permissão que faltava
+        with self.cs_lock:
+            if res.state != WANTED or res.timestamp != timestamp:
+                return
             with self.active_lock:
-                still_needed = set(self.active_peers.keys()) - self.replies_received
-            
-            if still_needed:
-                self.log(f"TIMEOUT! Não recebeu permissão de {still_needed}. Removendo-os.", level="error")
-                with self.active_lock:
-                    for peer_name in still_needed:
-                        self.active_peers.pop(peer_name, None)
-                        self.last_heartbeat.pop(peer_name, None)
-                self.requesting = False
-                return False
+                complete = self._enough_locked(res)
+            if complete:
+                self._enter_locked(res)
 
-            self.in_cs = True
-            self.log(">>> Entrou na SEÇÃO CRÍTICA <<<", level="sc")
-            self.cs_timer = threading.Timer(self.access_time_limit, self._auto_release_cs)
-            self.cs_timer.start()
-            return True
+    def _enter_locked(self, res):
+        # com cs_lock: o pedido em andamento tem todas as permissões
+        if res.timer is not None:
+            self.timers.cancel(res.timer)
+        ticket, res.ticket = res.ticket, None
+        res.enter()
+        res.entered = time.time()
+        self.feed.record(ENTER, self.clock, res.id, res.mode)
+        res.timer = self.timers.schedule(self.access_time_limit, self._auto_release_cs, res.id, res.timestamp)
+        self.stats["cs_entries"] += 1
+        if res.mode == READ:
+            # leitores simultâneos no momento da entrada, contando conosco
+            readers = res.sharers + 1
+            self.stats["read_entries"] += 1
+            self.stats["readers_last"] = readers
+            self.stats["readers_total"] += readers
+            self.stats["readers_max"] = max(self.stats["readers_max"], readers)
+        self._record_reply_wait(time.time() - res.since)
+        self.meter.observe("reply_wait", time.time() - res.since)
+        self.log(f">>> Entrou na SEÇÃO CRÍTICA{_label(res.id)} ({res.mode}) <<<", level="sc")
+        ticket.finish(True)
+
+    def _reply_deadline(self, res, timestamp):
+        # peers que falham são removidos pela thread de heartbeat (detector phi), o que
+        # também conta como permissão; reply_timeout é só o teto da espera por peers vivos porém lentos
+        with self.active_lock:
+            suspected = {p for p in res.awaiting if self.detector.is_suspected(p)}
+            for peer_name in suspected:
+                self._remove_peer(peer_name)
 
-    def release_cs(self):
         with self.cs_lock:
-            if not self.in_cs:
-                self.log("Não está na SC.", level="error")
+            if res.state != WANTED or res.timestamp != timestamp:
                 return
-            self.in_cs = False
-            self.requesting = False
-            self.request_timestamp = None
-            if self.cs_timer:
-                self.cs_timer.cancel()
-                self.cs_timer = None
-            self.log("<<< Saiu da SEÇÃO CRÍTICA >>>", level="sc")
-            while self.deferred_replies:
-                peer_name = self.deferred_replies.popleft()
-                uri = self.active_peers.get(peer_name)
-                if uri:
-                    try:
-                        with Pyro5.api.Proxy(uri) as proxy:
-                            proxy.receive_reply(self.name)
-                            self.log(f"Enviou REPLY (adiado) para {peer_name}", level="reply")
-                    except:
-                        self.log(f"Falha enviando REPLY para {peer_name}", level="error")
-
-    def _auto_release_cs(self):
-        self.log(f"Tempo limite {self.access_time_limit}s atingido. Liberando SC.", level="error")
-        self.release_cs()
-
-    def receive_request(self, peer_name, timestamp):
-        self.heartbeat(peer_name)
+            with self.active_lock:
+                still_needed = set(res.awaiting)
+                complete = self._enough_locked(res)
+            if complete:
+                self._enter_locked(res)
+                return
+            ticket, res.ticket = res.ticket, None
+            res.timer = None
+            self.stats["cs_timeouts"] += 1
+            self._record_reply_wait(time.time() - res.since)
+            res.release()
+            released = self._release_locked(res, timestamp)
+            self._forget_if_idle(res)
+
+        self.log(f"TIMEOUT{_label(res.id)}! Não recebeu permissão de {still_needed}. "
+                 f"Removendo suspeitos: {suspected or '-'}", level="error")
+        self._after_release(res, released)
+        ticket.finish(False)
+
+    def _record_reply_wait(self, elapsed):
+        self.stats["reply_wait_last"] = elapsed
+        self.stats["reply_wait_total"] += elapsed
+        self.stats["reply_wait_max"] = max(self.stats["reply_wait_max"], elapsed)
+
+    def _take_deferred(self, res):
+        # deve ser chamado com cs_lock adquirido
+        deferred = res.take_deferred()
+        self.stats["deferred_flushes"] += 1
+        self.stats["deferred_depth_last"] = len(deferred)
+        self.stats["deferred_depth_total"] += len(deferred)
+        self.stats["deferred_depth_max"] = max(self.stats["deferred_depth_max"], len(deferred))
+        return deferred
+
+    def _send_deferred_replies(self, resource_id, deferred):
+        # fora de locks: todos os REPLYs adiados saem em paralelo, cada um com o RTO do destino
+        with self.active_lock:
+            targets = {nm: self.active_peers[nm] for nm in deferred if nm in self.active_peers}
+        if not targets:
+            return
+        timeout = max(self._rto(nm) for nm in targets)
+        errors = self._fanout(targets, "receive_reply", self.name, resource_id, timeout=timeout,
+                              each={nm: {"timestamp": deferred[nm]} for nm in targets})
+        failed = {nm: err for nm, err in errors.items() if err is not None}
+        self.stats["deferred_sent"] += len(targets) - len(failed)
+        self.stats["deferred_failed"] += len(failed)
+        if len(failed) < len(targets):
+            self.log(f"Enviou REPLY{_label(resource_id)} (adiado) para {sorted(set(targets) - set(failed))}",
+                     level="reply")
+        for peer_name, err in failed.items():
+            self.log(f"Falha enviando REPLY{_label(resource_id)} para {peer_name}: {err}", level="error")
+
+    def release_cs(self, resource_id=DEFAULT_RESOURCE):
+        # retorna se havia posse a liberar (False: não estava na SC)
+        if not self._release(resource_id):
+            self.log(f"Não está na SC{_label(resource_id)}.", level="error")
+            return False
+        return True
+
+    def _release(self, resource_id, timestamp=None):
+        # libera a posse de `resource_id` (só a do pedido `timestamp`, se dado); retorna se liberou.
+        # Com timestamp (fim do prazo) a posse é encerrada mesmo com aquisições aninhadas.
+        with self.cs_lock:
+            res = self.resources.get(resource_id)
+            if res is None or res.state != HELD or timestamp not in (None, res.timestamp):
+                return False
+            if timestamp is None and res.depth > 1:
+                res.depth -= 1
+                self.log(f"Saiu de um nível aninhado da SC{_label(resource_id)} (restam {res.depth})", level="sc")
+                return True
+            timestamp = res.timestamp
+            res.release()
+            self.feed.record(EXIT, self.clock, resource_id)
+            if res.timer is not None:
+                self.timers.cancel(res.timer)
+                res.timer = None
+            released = self._release_locked(res, timestamp)
+            self.meter.observe("cs_hold", time.time() - res.entered)
+            res.entered = None
+            self._forget_if_idle(res)
+        self.log(f"<<< Saiu da SEÇÃO CRÍTICA{_label(resource_id)} >>>", level="sc")
+        self._after_release(res, released)
+        return True
+
+    def _auto_release_cs(self, resource_id, timestamp):
+        if self._release(resource_id, timestamp):
+            self.stats["lease_expired"] += 1
+            self.log(f"Prazo da posse esgotado. SC{_label(resource_id)} liberada.", level="error")
+
+    def renew_cs(self, resource_id=DEFAULT_RESOURCE, extension=None):
+        """
+        Estende a posse de `resource_id` por `extension` segundos a partir de agora
+        (padrão: access_time_limit), sem passar de max_hold_time desde a entrada.
+        Em vez de uma nova rodada de pedidos, custa um aviso a cada peer que espera
+        pelo recurso, para que o prazo de espera dele acompanhe a extensão.
+        Retorna quantos segundos de posse restam (0.0 se não estava na SC ou o teto foi atingido).
+        """
+        extension = self.access_time_limit if extension is None else extension
+        with self.cs_lock:
+            res = self.resources.get(resource_id)
+            if res is None or res.state != HELD:
+                self.log(f"Não está na SC{_label(resource_id)}.", level="error")
+                return 0.0
+            left = self.timers.remaining(res.timer)
+            lease = min(extension, res.entered + self.max_hold_time - time.time())
+            if lease <= left:
+                self.stats["renewals_refused"] += 1
+                self.log(f"Renovação da SC{_label(resource_id)} recusada: teto de {self.max_hold_time}s",
+                         level="error")
+                return left
+            self.timers.cancel(res.timer)
+            res.timer = self.timers.schedule(lease, self._auto_release_cs, res.id, res.timestamp)
+            self.stats["renewals"] += 1
+            waiters = self._lease_waiters_locked(res)
+        self.log(f"Posse da SC{_label(resource_id)} renovada por {lease:.1f}s", level="sc")
+        with self.active_lock:
+            targets = {nm: self.active_peers[nm] for nm in waiters if nm in self.active_peers}
+        if targets:
+            self._fanout(targets, "lease_renewed", self.name, resource_id, lease - left,
+                         timeout=self.send_timeout, oneway=True)
+        return lease
+
+    def _lease_waiters_locked(self, res):
+        # com cs_lock: peers que esperam por nós e devem saber que a posse foi estendida
+        return set(res.deferred)
+
+    def lease_renewed(self, holder, resource_id, added):
+        # `holder` estendeu a posse em `added` s: adia o prazo da nossa espera pelo mesmo tanto
+        self._mark_alive(holder)
+        self.meter.count_received("lease_renewed")
+        with self.cs_lock:
+            res = self.resources.get(resource_id)
+            if res is None or res.state != WANTED or res.timer is None:
+                return True
+            delay = self.timers.remaining(res.timer) + added
+            self.timers.cancel(res.timer)
+            res.timer = self.timers.schedule(delay, self._reply_deadline, res, res.timestamp)
+        return True
+
+    def receive_request(self, peer_name, timestamp, resource_id=DEFAULT_RESOURCE, mode=WRITE):
+        self._mark_alive(peer_name)
+        self.meter.count_received("receive_request")
         self.bump_clock(remote_ts=timestamp)
-        self.log(f"Recebeu REQUEST de {peer_name} (ts={timestamp})", level="request")
+        self.log(f"Recebeu REQUEST{_label(resource_id)} de {peer_name} (ts={timestamp}, {mode})", level="request")
 
-        must_defer = False
         with self.cs_lock:
-            if self.in_cs:
-                must_defer = True
-            elif self.requesting:
-                if (timestamp, peer_name) >= (self.request_timestamp, self.name):
-                    must_defer = True
+            # recurso que não conhecemos está RELEASED: não precisa ser criado
+            res = self.resources.get(resource_id)
+            if res is None:
+                must_defer = shared = False
+            else:
+                must_defer, shared = res.on_request(self.name, peer_name, timestamp, mode)
+            held = must_defer and res.state == HELD
+            if must_defer:
+                self.feed.record(DEFER, self.clock, resource_id, peer_name)
+            ask = None
+            if not must_defer and res is not None:
+                # quem entrou durante a nossa espera não recebeu nosso pedido: responder sem
+                # pedir a permissão dele deixaria os dois entrarem
+                with self.active_lock:
+                    if peer_name in self.active_peers and res.ask(peer_name):
+                        ask = (res.timestamp, res.mode)
 
         if must_defer:
             self.log(f"Adiar REPLY para {peer_name}", level="error")
-            self.deferred_replies.append(peer_name)
-            
-            if self.in_cs:
-                uri = self.active_peers.get(peer_name)
-                if uri:
-                    try:
-                        with Pyro5.api.Proxy(uri) as proxy:
-                            proxy._pyroOneway.add("heartbeat")
-                            proxy.heartbeat(self.name, is_busy=True)
-                    except Exception as e:
-                        self.log(f"Falha ao notificar {peer_name}: {e}", level="error")
+
+            if held and peer_name in self.active_peers:
+                self._post(peer_name, "heartbeat", is_busy=True)
 
         else:
+            if ask is not None:
+                self.log(f"Pedindo SC{_label(resource_id)} também a {peer_name}, que entrou depois", level="request")
+                self._post(peer_name, "receive_request", ask[0], resource_id, ask[1])
             last_hb = self.last_heartbeat.get(peer_name, 0)
             if time.time() - last_hb > self.hb_timeout:
                 self.log(f"Ignorando REQUEST do peer inativo {peer_name}", level="error")
                 return True
             
-            uri = self.active_peers.get(peer_name)
-            if uri:
-                try:
-                    with Pyro5.api.Proxy(uri) as proxy:
-                        proxy.receive_reply(self.name)
-                        self.log(f"Enviou REPLY imediato para {peer_name}", level="reply")
-                except Exception as e:
-                    self.log(f"Falha enviando REPLY para {peer_name}: {e}", level="error")
+            if peer_name in self.active_peers:
+                # pela fila do destino: REPLYs e avisos para o mesmo peer seguem num só deliver()
+                self._post(peer_name, "receive_reply", resource_id, shared=shared, timestamp=timestamp)
+                self.log(f"REPLY imediato para {peer_name} na fila", level="reply")
         
         return True 
 
-    def receive_reply(self, peer_name):
-        self.heartbeat(peer_name)
+    def receive_reply(self, peer_name, resource_id=DEFAULT_RESOURCE, shared=False, timestamp=None):
+        # shared: quem respondeu está lendo o recurso agora (métrica de concorrência de leitores).
+        # timestamp: o do pedido respondido; REPLY atrasado de um pedido anterior é ignorado
+        self._mark_alive(peer_name)
+        self.meter.count_received("receive_reply")
         self.bump_clock()
-        self.log(f"Recebeu REPLY de {peer_name}", level="reply")
-        with self.active_lock:
-            self.replies_received.add(peer_name)
+        self.log(f"Recebeu REPLY{_label(resource_id)} de {peer_name}", level="reply")
+        with self.cs_lock:
+            res = self.resources.get(resource_id)
+            if res is not None:
+                with self.active_lock:
+                    counted = res.on_reply(peer_name, timestamp, shared)
+                    complete = counted and self._enough_locked(res)
+                if counted:
+                    self.meter.observe("permission", time.time() - res.since, peer_name)
+                    self.feed.record(REPLY, self.clock, resource_id, peer_name)
+                if complete:
+                    self._enter_locked(res)
         return True
 
     # ----------------------
@@ -227,39 +903,108 @@ class Peer:
     # ----------------------
     def send_heartbeat(self):
         now = time.time()
-        
-        with self.cs_lock:
-            is_requesting = self.requesting
 
+        # snapshot curto: nenhuma chamada remota é feita com active_lock adquirido.
+        # Qualquer mensagem do protocolo atualiza last_heartbeat, então peers que
+        # falaram conosco recentemente não precisam de heartbeat explícito.
+        silence = self.hb_silence * self.hb_timeout
+        targets = {}
         with self.active_lock:
             for peer_name, uri in list(self.active_peers.items()):
                 last = self.last_heartbeat.get(peer_name, 0)
 
-                if now - last > self.hb_timeout:
-                    
-                    if not is_requesting:
-                        self.log(f"Peer {peer_name} não responde há {self.hb_timeout}s. Removendo da lista.", level="error")
-                        self.active_peers.pop(peer_name, None)
-                        self.last_heartbeat.pop(peer_name, None)
-    
+                if self.detector.is_suspected(peer_name, now):
+                    phi = self.detector.phi(peer_name, now)
+                    self.log(f"Peer {peer_name} suspeito (phi={phi:.1f}, sem notícias há {now - last:.1f}s). "
+                             f"Removendo da lista.", level="error")
+                    self._remove_peer(peer_name)
+                    continue
+
+                if now - last >= silence:
+                    targets[peer_name] = uri
+
+            skipped = len(self.active_peers) - len(targets)
+            kwargs = {}
+            if self.hb_mode == "gossip":
+                if len(targets) > self.hb_fanout:
+                    skipped += len(targets) - self.hb_fanout
+                    targets = dict(random.sample(list(targets.items()), self.hb_fanout))
+                kwargs["digest"] = self._gossip_digest(now)
+
+        self.stats["hb_sent"] += len(targets)
+        self.stats["hb_skipped"] += skipped
+        if not targets:
+            return
+
+        # oneway: a resposta chega como heartbeat_ack, que também mede o RTT
+        errors = self._fanout(targets, "heartbeat", self.name, timeout=self.hb_timeout,
+                              oneway=True, sent_at=now, **kwargs)
+
+        with self.active_lock:
+            for peer_name, err in errors.items():
+                if err is None or self.active_peers.get(peer_name) != targets[peer_name]:
                     continue
-                
-                try:
-                    with Pyro5.api.Proxy(uri) as proxy:
-                        proxy.heartbeat(self.name)
-                except Exception as e:
-                    self.log(f"Falha de comunicação com {peer_name}, removendo-o. Erro: {e}", level="error")
-                    self.active_peers.pop(peer_name, None)
-                    self.last_heartbeat.pop(peer_name, None)
-
-    def heartbeat(self, from_peer, is_busy=False):
-        self.last_heartbeat[from_peer] = time.time()
+                self.log(f"Falha de comunicação com {peer_name}, removendo-o. Erro: {err}", level="error")
+                self._remove_peer(peer_name)
+
+    def heartbeat(self, from_peer, is_busy=False, sent_at=None, digest=None):
+        self._mark_alive(from_peer)
+        self.meter.count_received("heartbeat")
         
         if is_busy:
             self.log(f"Acesso negado. {from_peer} está atualmente na Seção Crítica.", level="error")
+
+        if digest is not None:
+            self._merge_digest(digest)
+
+        if sent_at is not None:
+            kwargs = {}
+            if digest is not None:
+                kwargs["digest"] = self._gossip_digest(time.time())
+            self.stats["hb_acks"] += 1
+            self._post(from_peer, "heartbeat_ack", sent_at, **kwargs)
             
         return True
 
+    def heartbeat_ack(self, from_peer, sent_at, digest=None):
+        now = time.time()
+        self._mark_alive(from_peer, now)
+        self.meter.count_received("heartbeat_ack")
+        if digest is not None:
+            self._merge_digest(digest)
+        rtt = now - sent_at
+        self.meter.observe("hb_rtt", rtt, from_peer)
+        with self.active_lock:
+            if from_peer not in self.active_peers:
+                return True
+            # SRTT/RTTVAR como no TCP (RFC 6298)
+            srtt = self.hb_rtt.get(from_peer)
+            if srtt is None:
+                self.hb_rtt[from_peer] = rtt
+                self.hb_rttvar[from_peer] = rtt / 2
+            else:
+                var = self.hb_rttvar[from_peer]
+                self.hb_rttvar[from_peer] = var + RTT_BETA * (abs(srtt - rtt) - var)
+                self.hb_rtt[from_peer] = srtt + RTT_ALPHA * (rtt - srtt)
+        return True
+
+    def _gossip_digest(self, now):
+        # idade (s) da última notícia de cada peer vivo; idades não dependem do relógio do outro host
+        digest = {self.name: 0.0}
+        for peer_name, last in list(self.last_heartbeat.items()):
+            age = now - last
+            if age <= self.hb_timeout:
+                digest[peer_name] = age
+        return digest
+
+    def _merge_digest(self, digest):
+        now = time.time()
+        with self.active_lock:
+            for peer_name, age in digest.items():
+                # só atualiza peers conhecidos: gossip não ressuscita quem já foi removido
+                if peer_name != self.name and peer_name in self.active_peers:
+                    self._mark_alive(peer_name, now - age)
+
     # ----------------------
     # Threads auxiliares
     # ----------------------
@@ -268,28 +1013,66 @@ class Peer:
             self.send_heartbeat()
             time.sleep(self.hb_interval)
 
+    def _metrics_thread(self):
+        while not self._stop:
+            time.sleep(self.metrics_interval)
+            self._dump_metrics()
+
+    def _dump_metrics(self):
+        try:
+            dump_json(self.metrics_file, self.metrics())
+        except Exception as e:
+            self.log(f"Falha gravando métricas em {self.metrics_file}: {e}", level="error")
+
     def _start_background_threads(self):
+        if self.runtime is not None:
+            # as mesmas rodadas, agendadas no event loop em vez de uma thread cada
+            self._periodic.append(self.runtime.every(self.hb_interval, self.send_heartbeat))
+            if self.metrics_file:
+                self._periodic.append(self.runtime.every(self.metrics_interval, self._dump_metrics,
+                                                         first=self.metrics_interval))
+            return
         t = threading.Thread(target=self._heartbeat_thread, daemon=True)
         t.start()
         self.threads.append(t)
+        if self.metrics_file:
+            t = threading.Thread(target=self._metrics_thread, daemon=True)
+            t.start()
+            self.threads.append(t)
 
     def shutdown(self):
+        if self._stop:
+            return True
         self.log("Shutdown requested.", level="error")
 
         try:
-            ns = Pyro5.api.locate_ns()
+            ns = get_ns(*self.ns_address) if self.ns_address else Pyro5.api.locate_ns()
             ns.remove(self.name)
             self.log("Successfully removed from the Name Server.", level="error")
         except Exception as e:
             self.log(f"Failed to remove from Name Server during shutdown: {e}", level="error")
 
+        try:
+            self._announce({}, [self.name])
+        except Exception as e:
+            self.log(f"Falha ao anunciar saída: {e}", level="error")
+
         self._stop = True
-        if self.cs_timer:
-            self.cs_timer.cancel()
+        for task in self._periodic:
+            task.cancel()
+        self.timers.stop()
+        self.proxies.close()
+        self._executor.shutdown(wait=False)
+
+        local_transport.unhost(self)
+        daemon = self._pyroDaemon
 
         def do_shutdown():
             time.sleep(0.1)
-            self._pyroDaemon.shutdown()
+            daemon.unregister(self)
+            # o daemon pode hospedar outros peers (start_peer com vários nomes): só o último o encerra
+            if len(daemon.objectsById) <= 1:
+                daemon.shutdown()
 
         t = threading.Thread(target=do_shutdown)
         t.daemon = False
@@ -297,15 +1080,113 @@ class Peer:
         
         return True
 
+    # ----------------------
+    # Injeção de falhas de rede
+    # ----------------------
+    def set_network_faults(self, delay=0.0, jitter=0.0, drop=0.0, peers=None):
+        """
+        Atraso (s), jitter (s) e probabilidade de perda das mensagens que este peer
+        envia; `peers` restringe as regras aos enlaces para esses peers. Zeros desligam.
+        """
+        self.proxies.configure(delay, jitter, drop, peers)
+        target = ", ".join(peers) if peers else "todos"
+        self.log(f"Falhas de rede para {target}: delay={delay}s jitter={jitter}s drop={drop}", level="error")
+        return self.proxies.snapshot()
+
+    def set_partition(self, peers):
+        # `peers` ficam inalcançáveis a partir deste peer; lista vazia desfaz a partição
+        self.proxies.set_partition(peers)
+        self.log(f"Partição: {sorted(peers) or '-'}", level="error")
+        return self.proxies.snapshot()
+
+    def clear_network_faults(self):
+        self.proxies.clear()
+        self.log("Falhas de rede removidas.", level="error")
+        return self.proxies.snapshot()
+
+    def events(self, since=0, limit=None):
+        """
+        Eventos do protocolo com seq > `since`, do buffer circular deste peer:
+        {"name", "events": [(seq, time, clock, type, resource, detail), ...], "lost"}.
+        lost conta os eventos que saíram do buffer antes de serem lidos.
+        """
+        feed = self.feed.since(since, limit)
+        feed["name"] = self.name
+        return feed
+
     def list_active_peers(self):
         with self.active_lock:
             return dict(self.active_peers)
 
     def info(self):
+        with self.cs_lock:
+            res = self.resources.get(DEFAULT_RESOURCE)
+            state = res.state if res is not None else RELEASED
+            mode = res.mode if res is not None and state != RELEASED else None
+            depth = res.depth if res is not None else 0
+            # segundos restantes de posse de cada recurso mantido
+            leases = {rid: round(self.timers.remaining(r.timer), 3) for rid, r in self.resources.items()
+                      if r.state == HELD and r.timer is not None}
+            # recursos nomeados em uso (os RELEASED só guardam estado de outros peers)
+            resources = {rid: r.state for rid, r in self.resources.items() if r.state != RELEASED}
+            reading = sum(1 for r in self.resources.values() if r.state == HELD and r.mode == READ)
         with self.active_lock:
             return {
                 "name": self.name,
                 "clock": self.clock,
-                "in_cs": self.in_cs,
-                "active_peers": list(self.active_peers.keys())
-            }
\ No newline at end of file
+                "in_cs": state == HELD,
+                "state": state,
+                "mode": mode,
+                "depth": depth,
+                "resources": resources,
+                "leases": leases,
+                "max_hold_time": self.max_hold_time,
+                "reads_held": reading,
+                "active_peers": list(self.active_peers.keys()),
+                "hb_rtt": dict(self.hb_rtt),
+                "rto": {p: self._rto(p) for p in self.active_peers},
+                "failure_detector": self.detector.snapshot(),
+                "proxy_pool": self.proxies.stats(),
+                "network_faults": self.proxies.snapshot(),
+                "stats": self._stats_snapshot(),
+            }
+
+    def metrics(self):
+        """
+        Onde o tempo vai. Latências em ms (contagem, média, p50/p90/p99, máximo):
+          reply_wait -- do pedido à última permissão (entrada na SC)
+          permission -- do pedido a cada permissão, também por peer (REPLY, voto ou token)
+          cs_hold    -- posse da SC
+          hb_rtt     -- ida e volta de heartbeat, também por peer
+        Mais mensagens enviadas/recebidas por método, profundidade da fila de REPLYs
+        adiados e reconexões/timeouts do pool de proxies.
+        """
+        snapshot = self.meter.snapshot()
+        with self.cs_lock:
+            deferred_now = sum(len(r.deferred) for r in self.resources.values())
+        stats = self._stats_snapshot()
+        snapshot.update({
+            "name": self.name,
+            "time": time.time(),
+            "deferred_depth": {
+                "now": deferred_now,
+                "last": stats["deferred_depth_last"],
+                "max": stats["deferred_depth_max"],
+                "avg": round(stats["deferred_depth_avg"], 3),
+            },
+            "proxy_pool": self.proxies.stats(),
+            "stats": stats,
+        })
+        return snapshot
+
+    def _stats_snapshot(self):
+        stats = dict(self.stats)
+        waits = stats["cs_entries"] + stats["cs_timeouts"]
+        stats["reply_wait_avg"] = stats["reply_wait_total"] / waits if waits else 0.0
+        # inclui heartbeats; ver hb_sent para separar o tráfego de fundo
+        stats["msgs_per_entry"] = stats["msgs_sent"] / stats["cs_entries"] if stats["cs_entries"] else 0.0
+        reads = stats["read_entries"]
+        stats["readers_avg"] = stats["readers_total"] / reads if reads else 0.0
+        flushes = stats["deferred_flushes"]
+        stats["deferred_depth_avg"] = stats["deferred_depth_total"] / flushes if flushes else 0.0
+        return stats
\ No newline at end of file
@@ -0,0 +1,179 @@
+# proxy_pool.py
+# Pool de proxies Pyro5 persistentes, indexado pelo nome do peer.
+# Evita abrir uma conexão TCP nova (connect + handshake) a cada REQUEST/REPLY/heartbeat.
+import threading
+import Pyro5.api
+import Pyro5.errors
+import local_transport
+
+
+class ProxyPool:
+    """
+    Mantém proxies ociosos por peer. Cada chamada retira um proxy do pool
+    (proxies Pyro não podem ser usados por duas threads ao mesmo tempo),
+    executa o método e devolve o proxy. Em falha de comunicação o proxy é
+    descartado e a chamada é refeita uma vez com uma conexão nova.
+    `serializer` escolhe o serializador dos proxies (None: o padrão do Pyro).
+    bytes_sent/bytes_received contam o tráfego das chamadas, sem o handshake da conexão.
+    Destinos hospedados neste processo (local_transport.host) são chamados direto no
+    objeto, sem proxy nem socket; essas chamadas aparecem em `local`.
+    """
+
+    def __init__(self, max_idle_per_peer=4, serializer=None):
+        self.max_idle_per_peer = max_idle_per_peer
+        self.serializer = serializer
+        self._lock = threading.Lock()
+        self._idle = {}   # peer_name -> (uri, [proxies])
+        self.counters = {
+            "calls": 0,
+            "local": 0,
+            "reused": 0,
+            "created": 0,
+            "reconnects": 0,
+            "failures": 0,
+            "timeouts": 0,
+            "evicted": 0,
+            "bytes_sent": 0,
+            "bytes_received": 0,
+        }
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.counters[key] += n
+
+    def _checkout(self, peer_name, uri):
+        uri = str(uri)
+        with self._lock:
+            entry = self._idle.get(peer_name)
+            if entry is not None:
+                cached_uri, proxies = entry
+                if cached_uri != uri:
+                    # peer re-registrado com outra URI: conexões antigas não servem mais
+                    self._idle.pop(peer_name, None)
+                    self.counters["evicted"] += len(proxies)
+                    stale = proxies
+                    proxies = []
+                else:
+                    stale = []
+                if proxies:
+                    proxy = proxies.pop()
+                    self.counters["reused"] += 1
+                    proxy._pyroClaimOwnership()
+                    return proxy, True
+            else:
+                stale = []
+            self.counters["created"] += 1
+        for old in stale:
+            _release(old)
+        return self._new_proxy(uri), False
+
+    def _new_proxy(self, uri):
+        proxy = Pyro5.api.Proxy(uri)
+        if self.serializer:
+            proxy._pyroSerializer = self.serializer
+        return proxy
+
+    def _bind(self, proxy):
+        # conecta já (em vez de na primeira chamada) para contar os bytes desde a primeira mensagem
+        proxy._pyroBind()
+        conn = proxy._pyroConnection
+        send, recv = conn.send, conn.recv
+
+        def counted_send(data):
+            send(data)
+            self._count("bytes_sent", len(data))
+
+        def counted_recv(size):
+            data = recv(size)
+            self._count("bytes_received", len(data))
+            return data
+
+        conn.send, conn.recv = counted_send, counted_recv
+
+    def _checkin(self, peer_name, proxy):
+        uri = str(proxy._pyroUri)
+        with self._lock:
+            entry = self._idle.setdefault(peer_name, (uri, []))
+            if entry[0] == uri and len(entry[1]) < self.max_idle_per_peer:
+                entry[1].append(proxy)
+                return
+        _release(proxy)
+
+    def call(self, peer_name, uri, method, *args, timeout=None, oneway=False, **kwargs):
+        """
+        Chama `method` no peer remoto reaproveitando uma conexão do pool.
+        Propaga a exceção se a chamada falhar também após a reconexão.
+        """
+        self._count("calls")
+        target = local_transport.lookup(uri)
+        if target is not None:
+            self._count("local")
+            try:
+                return local_transport.call(target, method, args, kwargs, oneway)
+            except Exception:
+                self._count("failures")
+                raise
+        proxy, reused = self._checkout(peer_name, uri)
+        while True:
+            proxy._pyroTimeout = timeout
+            if oneway:
+                proxy._pyroOneway.add(method)
+            else:
+                proxy._pyroOneway.discard(method)
+            try:
+                if proxy._pyroConnection is None:
+                    self._bind(proxy)
+                result = getattr(proxy, method)(*args, **kwargs)
+            except Pyro5.errors.TimeoutError:
+                # resposta pendente na conexão: ela não pode mais ser reaproveitada
+                _release(proxy)
+                self._count("failures")
+                self._count("timeouts")
+                raise
+            except Pyro5.errors.CommunicationError:
+                _release(proxy)
+                if not reused:
+                    self._count("failures")
+                    raise
+                # conexão ociosa pode ter sido fechada pelo outro lado: reconecta uma vez
+                self._count("reconnects")
+                proxy, reused = self._new_proxy(str(uri)), False
+                continue
+            except Exception:
+                # exceção remota: a conexão continua válida
+                self._checkin(peer_name, proxy)
+                self._count("failures")
+                raise
+            self._checkin(peer_name, proxy)
+            return result
+
+    def evict(self, peer_name):
+        with self._lock:
+            entry = self._idle.pop(peer_name, None)
+            if entry is not None:
+                self.counters["evicted"] += len(entry[1])
+        if entry is not None:
+            for proxy in entry[1]:
+                _release(proxy)
+
+    def close(self):
+        with self._lock:
+            names = list(self._idle.keys())
+        for nm in names:
+            self.evict(nm)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["idle"] = sum(len(p) for _, p in self._idle.values())
+        calls = stats["calls"]
+        stats["reuse_ratio"] = round(stats["reused"] / calls, 3) if calls else 0.0
+        return stats
+
+
+def _release(proxy):
+    try:
+        proxy._pyroClaimOwnership()
+        proxy._pyroRelease()
+    except Exception:
+        pass
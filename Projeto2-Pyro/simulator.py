@@ -0,0 +1,336 @@
+# simulator.py
+# Simulação de eventos discretos do Ricart & Agrawala (e da k-exclusão) usando o mesmo
+# núcleo do Peer (mutex_core), sem Pyro, threads nem rede: latência sorteada por
+# mensagem, perda de mensagens e quedas de peers em instantes definidos. Roda
+# centenas de peers em segundos e imprime as mesmas métricas do benchmark.py.
+# Uso: python simulator.py [--peers 100] [--latency exp:0.005] [--loss 0.01] [--crash S3@0.5] [opções]
+#      python simulator.py --help  # lista as opções
+import argparse
+import heapq
+import itertools
+import json
+import random
+import time
+from benchmark import summarize
+from mutex_core import DEFAULT_RESOURCE, HELD, READ, WANTED, WRITE, CSState, lamport_tick
+
+ALGORITHMS = ("ricart", "kmutex")
+
+
+def parse_latency(spec):
+    """
+    "const:A", "uniform:A,B", "exp:MEDIA" ou "lognormal:MU,SIGMA" (segundos) ->
+    função rng -> atraso de uma mensagem.
+    """
+    kind, _, params = spec.partition(":")
+    try:
+        values = [float(v) for v in params.split(",")] if params else []
+    except ValueError:
+        raise ValueError(f"latência inválida: {spec}")
+    if kind == "const" and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(*values)
+    if kind == "exp" and len(values) == 1 and values[0] > 0:
+        return lambda rng: rng.expovariate(1.0 / values[0])
+    if kind == "lognormal" and len(values) == 2:
+        return lambda rng: rng.lognormvariate(*values)
+    raise ValueError(f"latência inválida: {spec}")
+
+
+def parse_crash(spec):
+    # "S3@0.5" -> ("S3", 0.5)
+    name, _, at = spec.partition("@")
+    try:
+        return name, float(at)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"queda inválida: {spec} (formato NOME@SEGUNDOS)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(usage="python simulator.py [opções]")
+    parser.add_argument("--algorithm", choices=ALGORITHMS, default="ricart")
+    parser.add_argument("--peers", type=int, default=100, help="número de peers (S0, S1, ...)")
+    parser.add_argument("--cycles", type=int, default=20, help="pedidos de SC por peer")
+    parser.add_argument("--hold", type=float, default=0.01, help="tempo (s) dentro da SC")
+    parser.add_argument("--think", type=float, default=0.0,
+                        help="pausa média (s, exponencial) entre uma saída e o próximo pedido")
+    parser.add_argument("--resources", type=int, default=1,
+                        help="recursos distintos; cada pedido sorteia um (1 = recurso padrão)")
+    parser.add_argument("--read-ratio", type=float, default=0.0,
+                        help="fração dos pedidos em modo READ (só --algorithm ricart)")
+    parser.add_argument("--k", type=int, default=1, help="vagas com --algorithm kmutex")
+    parser.add_argument("--latency", default="exp:0.005",
+                        help="atraso por mensagem: const:A | uniform:A,B | exp:MEDIA | lognormal:MU,SIGMA")
+    parser.add_argument("--loss", type=float, default=0.0, help="probabilidade de perder cada mensagem")
+    parser.add_argument("--crash", type=parse_crash, action="append", default=[], metavar="NOME@T",
+                        help="derruba o peer NOME no instante T (s); pode repetir")
+    parser.add_argument("--detect-delay", type=float, default=1.0,
+                        help="tempo (s) até os demais removerem um peer que caiu")
+    parser.add_argument("--reply-timeout", type=float, default=5.0,
+                        help="desiste do pedido se as permissões não chegarem nesse tempo (s)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="grava o JSON também neste arquivo")
+    args = parser.parse_args(argv)
+    try:
+        args.delay = parse_latency(args.latency)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.peers < 1:
+        parser.error("--peers deve ser ao menos 1")
+    if not 0.0 <= args.loss < 1.0:
+        parser.error("--loss deve estar em [0, 1)")
+    if args.read_ratio > 0 and args.algorithm != "ricart":
+        parser.error(f"--algorithm {args.algorithm} não tem modo READ")
+    if args.k != 1 and args.algorithm != "kmutex":
+        parser.error("--k só vale com --algorithm kmutex")
+    if args.k < 1:
+        parser.error("--k deve ser ao menos 1")
+    return args
+
+
+class Simulation:
+    """
+    Fila de eventos (instante, seq, função, args) em tempo simulado. `send` agenda a
+    entrega de uma mensagem após a latência sorteada, salvo perda ou destino caído.
+    Também acompanha quem está na SC de cada recurso para contar violações de segurança.
+    """
+
+    def __init__(self, delay, loss, rng, k=1, detect_delay=1.0):
+        self.now = 0.0
+        self.delay = delay
+        self.loss = loss
+        self.rng = rng
+        self.k = k
+        self.detect_delay = detect_delay
+        self.peers = {}
+        self.lost = 0
+        self.holders = {}          # recurso -> {peer: modo} dentro da SC
+        self.violations = 0
+        self._queue = []
+        self._seq = itertools.count()
+
+    def at(self, when, fn, *args):
+        heapq.heappush(self._queue, (when, next(self._seq), fn, args))
+
+    def after(self, delay, fn, *args):
+        self.at(self.now + delay, fn, *args)
+
+    def send(self, dest, method, *args):
+        if self.rng.random() < self.loss:
+            self.lost += 1
+            return
+        self.after(self.delay(self.rng), self._deliver, dest, method, args)
+
+    def _deliver(self, dest, method, args):
+        peer = self.peers[dest]
+        if peer.alive:
+            getattr(peer, method)(*args)
+
+    def run(self):
+        while self._queue:
+            self.now, _, fn, args = heapq.heappop(self._queue)
+            fn(*args)
+
+    def entered(self, peer, res):
+        holders = self.holders.setdefault(res.id, {})
+        holders[peer.name] = res.mode
+        if len(holders) > self.k and WRITE in holders.values():
+            self.violations += 1
+
+    def exited(self, peer, res):
+        holders = self.holders.get(res.id, {})
+        holders.pop(peer.name, None)
+        if not holders:
+            self.holders.pop(res.id, None)
+
+    def crash(self, name):
+        peer = self.peers[name]
+        if not peer.alive:
+            return
+        peer.alive = False
+        for holders in self.holders.values():
+            holders.pop(name, None)
+        self.after(self.detect_delay, self._detected, name)
+
+    def _detected(self, name):
+        for peer in self.peers.values():
+            if peer.alive:
+                peer.remove_peer(name)
+
+
+class SimPeer:
+    """
+    Peer simulado: as decisões (relógio, adiar ou responder, contagem de respostas)
+    são as de CSState, como no Peer; envio, timers e detecção de falhas ficam com a
+    Simulation. A visão de membros é atualizada `detect_delay` após cada queda.
+    """
+
+    def __init__(self, sim, name, config, rng):
+        self.sim = sim
+        self.name = name
+        self.config = config
+        self.rng = rng
+        self.k = config["k"]
+        self.clock = 0
+        self.alive = True
+        self.view = set()
+        self.resources = {}
+        self.remaining = config["cycles"]
+        self.pending = None        # (recurso, modo, instante do pedido) em andamento
+        self.events = []
+        self.stats = {"cs_entries": 0, "cs_timeouts": 0, "msgs_sent": 0, "hb_sent": 0, "hb_acks": 0}
+
+    def bump_clock(self, remote_ts=None):
+        self.clock = lamport_tick(self.clock, remote_ts)
+        return self.clock
+
+    def _send(self, dest, method, *args):
+        self.stats["msgs_sent"] += 1
+        self.sim.send(dest, method, *args)
+
+    def _resource(self, resource_id):
+        res = self.resources.get(resource_id)
+        if res is None:
+            res = self.resources[resource_id] = CSState(resource_id)
+        return res
+
+    def _forget_if_idle(self, res):
+        if res.idle():
+            self.resources.pop(res.id, None)
+
+    # ----------------------
+    # Carga
+    # ----------------------
+    def next_cycle(self):
+        if not self.alive or self.remaining == 0:
+            return
+        self.remaining -= 1
+        think = self.config["think"]
+        self.sim.after(self.rng.expovariate(1.0 / think) if think > 0 else 0.0, self.request_cs)
+
+    def request_cs(self):
+        if not self.alive:
+            return
+        count = self.config["resources"]
+        resource_id = DEFAULT_RESOURCE if count == 1 else f"r{self.rng.randrange(count)}"
+        mode = READ if self.rng.random() < self.config["read_ratio"] else WRITE
+        res = self._resource(resource_id)
+        timestamp = self.bump_clock()
+        res.request(timestamp, mode, self.view)
+        self.pending = (resource_id, mode, self.sim.now)
+        for nm in self.view:
+            self._send(nm, "receive_request", self.name, timestamp, resource_id, mode)
+        self.sim.after(self.config["reply_timeout"], self._reply_deadline, res, timestamp)
+        self._check(res)
+
+    def _check(self, res):
+        if res.state == WANTED and res.enough(self.k):
+            res.enter()
+            self.stats["cs_entries"] += 1
+            self.sim.entered(self, res)
+            self.sim.after(self.config["hold"], self.release_cs, res, self.sim.now)
+
+    def _reply_deadline(self, res, timestamp):
+        if not self.alive or res.state != WANTED or res.timestamp != timestamp:
+            return
+        self.stats["cs_timeouts"] += 1
+        resource_id, mode, requested = self.pending
+        self.events.append((self.name, resource_id, mode, False, requested, self.sim.now, None))
+        res.release()
+        self._flush_deferred(res)
+        self.next_cycle()
+
+    def release_cs(self, res, entered):
+        if not self.alive:
+            return
+        self.sim.exited(self, res)
+        resource_id, mode, requested = self.pending
+        self.events.append((self.name, resource_id, mode, True, requested, entered, self.sim.now))
+        res.release()
+        self._flush_deferred(res)
+        self.next_cycle()
+
+    def _flush_deferred(self, res):
+        for nm, ts in res.take_deferred().items():
+            if nm in self.view:
+                self._send(nm, "receive_reply", self.name, res.id, False, ts)
+        self._forget_if_idle(res)
+
+    # ----------------------
+    # Mensagens
+    # ----------------------
+    def receive_request(self, sender, timestamp, resource_id, mode):
+        self.bump_clock(remote_ts=timestamp)
+        res = self.resources.get(resource_id)
+        defer, shared = res.on_request(self.name, sender, timestamp, mode) if res else (False, False)
+        if not defer:
+            self._send(sender, "receive_reply", self.name, resource_id, shared, timestamp)
+
+    def receive_reply(self, sender, resource_id, shared, timestamp):
+        self.bump_clock()
+        res = self.resources.get(resource_id)
+        if res is not None and res.on_reply(sender, timestamp, shared):
+            self._check(res)
+
+    def remove_peer(self, name):
+        # o detector de falhas declarou `name` morto: sai da visão e conta como permissão
+        self.view.discard(name)
+        for res in list(self.resources.values()):
+            res.deferred.pop(name, None)
+            if name in res.awaiting:
+                res.awaiting.discard(name)
+                self._check(res)
+            elif res.state != HELD:
+                self._forget_if_idle(res)
+
+
+def run(config, delay):
+    rng = random.Random(config["seed"])
+    sim = Simulation(delay, config["loss"], rng, config["k"], config["detect_delay"])
+    names = [f"S{i}" for i in range(config["peers"])]
+    for nm in names:
+        sim.peers[nm] = SimPeer(sim, nm, config, random.Random(f"{config['seed']}:{nm}"))
+    for peer in sim.peers.values():
+        peer.view = set(names) - {peer.name}
+        peer.next_cycle()
+    for nm, at in config["crash"]:
+        if nm not in sim.peers:
+            raise ValueError(f"--crash: peer desconhecido {nm}")
+        sim.at(at, sim.crash, nm)
+
+    start = time.time()
+    sim.run()
+    real = time.time() - start
+
+    events = [e for p in sim.peers.values() for e in p.events]
+    stats = {nm: p.stats for nm, p in sim.peers.items()}
+    granted = [e for e in events if e[3]]
+    duration = max(e[6] for e in granted) - min(e[4] for e in events) if granted else sim.now
+    result = summarize(config, events, stats, duration)
+    result["simulation"] = {
+        "sim_time_s": round(sim.now, 3),
+        "real_time_s": round(real, 3),
+        "speedup": round(sim.now / real, 1) if real > 0 else 0.0,
+        "msgs_lost": sim.lost,
+        "crashed": [nm for nm, p in sim.peers.items() if not p.alive],
+        "safety_violations": sim.violations,
+    }
+    return result
+
+
+def main():
+    args = parse_args()
+    config = vars(args).copy()
+    delay = config.pop("delay")
+    output = config.pop("output")
+    result = run(config, delay)
+    text = json.dumps(result, indent=2)
+    print(text)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
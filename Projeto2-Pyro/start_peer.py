@@ -1,81 +1,167 @@
 # start_peer.py
-# Uso: python start_peer.py <PeerName> <port> [nameserver_host] [nameserver_port]
+# Uso: python start_peer.py <PeerName>[,<PeerName>...] <port> [nameserver_host] [nameserver_port] [opções]
+#      python start_peer.py --help  # lista as opções
+import argparse
 import sys
-import threading
-import time
 import Pyro5.api
-from nameserver_helper import get_or_start_nameserver
-from peer import Peer
+import Pyro5.serializers
+import local_transport
+from async_runtime import default_runtime
+from nameserver_helper import MembershipWatcher, get_or_start_nameserver, group_tag, register_peer
+from hierarchical import GLOBAL_GROUP, HierarchicalPeer
+from k_mutex import KMutexPeer
+from maekawa import MaekawaPeer
+from peer import HB_MODES, Peer
+from suzuki_kasami import TokenPeer
+
+# algoritmos de exclusão mútua selecionáveis; todos os peers do cluster devem usar o mesmo
+ALGORITHMS = {
+    "ricart": Peer,
+    "maekawa": MaekawaPeer,
+    "token": TokenPeer,
+    "kmutex": KMutexPeer,
+    "hier": HierarchicalPeer,
+}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        usage="python start_peer.py <PeerName> <port> [ns_host] [ns_port] [opções]")
+    parser.add_argument("name", help="nome do peer; vários separados por vírgula (P1,P2,P3) compartilham "
+                                     "o processo e o daemon, e se falam sem passar pela rede")
+    parser.add_argument("port", type=int)
+    parser.add_argument("ns_host", nargs="?", default="localhost")
+    parser.add_argument("ns_port", nargs="?", type=int, default=9090)
+    parser.add_argument("--algorithm", choices=sorted(ALGORITHMS), default="ricart",
+                        help="ricart: Ricart & Agrawala (2(N-1) msgs/entrada); maekawa: quóruns em grade (O(sqrt N)); "
+                             "token: Suzuki-Kasami (0 msgs para quem já tem o token); "
+                             "kmutex: até --k peers na SC ao mesmo tempo; "
+                             "hier: R&A dentro do --group e entre os coordenadores dos grupos")
+    parser.add_argument("--group", default=None,
+                        help="grupo de peers: só peers do mesmo grupo competem entre si (cada grupo pode ter seu "
+                             "algoritmo e seu --k); sem --group o peer vê todos os peers do NameServer")
+    parser.add_argument("--global-group", default=GLOBAL_GROUP,
+                        help="grupo do NameServer dos coordenadores com --algorithm hier; igual em todos os grupos")
+    parser.add_argument("--k", type=int, default=1,
+                        help="vagas simultâneas na SC com --algorithm kmutex; igual em todo o grupo")
+    parser.add_argument("--hb-mode", choices=HB_MODES, default="all",
+                        help="all: sonda todo peer silencioso; gossip: sonda só --hb-fanout peers por rodada")
+    parser.add_argument("--hb-fanout", type=int, default=3,
+                        help="peers sondados por rodada no modo gossip")
+    parser.add_argument("--hb-silence", type=float, default=0.5,
+                        help="fração de hb_timeout sem notícias do peer antes de mandar heartbeat explícito")
+    parser.add_argument("--max-hold", type=float, default=60.0,
+                        help="teto (s) da posse da SC com renew_cs, contado da entrada; igual em todo o cluster")
+    parser.add_argument("--reentrant", action="store_true",
+                        help="request_cs de um recurso já mantido aninha a posse em vez de falhar")
+    parser.add_argument("--discovery-interval", type=float, default=10.0,
+                        help="intervalo (s) do poll de fallback ao NameServer; entradas/saídas chegam por push")
+    parser.add_argument("--runtime", choices=("threads", "async"), default="threads",
+                        help="threads: heartbeat, timers e envios em threads próprias do peer; "
+                             "async: um event loop asyncio e pools limitados por processo")
+    parser.add_argument("--serializer", choices=sorted(Pyro5.serializers.serializers), default=None,
+                        help="serializador das chamadas entre peers (padrão do Pyro: serpent); "
+                             "msgpack só aparece com o pacote msgpack instalado")
+    parser.add_argument("--metrics-file", default=None,
+                        help="grava o snapshot de metrics() neste arquivo JSON periodicamente")
+    parser.add_argument("--metrics-interval", type=float, default=10.0,
+                        help="intervalo (s) entre gravações de --metrics-file")
+    args = parser.parse_args(argv)
+    if args.k != 1 and args.algorithm != "kmutex":
+        parser.error("--k só vale com --algorithm kmutex")
+    if args.algorithm == "hier" and not args.group:
+        # sem grupo o peer veria todo o NameServer, inclusive os peers globais (<nome>.global)
+        parser.error("--algorithm hier exige --group")
+    return args
 
 def main():
-    if len(sys.argv) < 3:
-        print("Uso: python start_peer.py <PeerName> <port> [ns_host] [ns_port]")
-        sys.exit(1)
-    name = sys.argv[1]
-    port = int(sys.argv[2])
-    ns_host = "localhost"
-    ns_port = 9090
-    if len(sys.argv) >= 4:
-        ns_host = sys.argv[3]
-    if len(sys.argv) >= 5:
-        ns_port = int(sys.argv[4])
+    args = parse_args()
+    # vários nomes separados por vírgula: peers co-localizados no mesmo processo e daemon
+    names = [nm for nm in args.name.split(",") if nm]
+    port = args.port
+    ns_host = args.ns_host
+    ns_port = args.ns_port
 
     # Localizar ou criar NameServer
     ns = get_or_start_nameserver(host=ns_host, port=ns_port)
 
-    # cria a instância peer
-    p = Peer(name=name)
+    # cria as instâncias peer
+    peer_class = ALGORITHMS[args.algorithm]
+    kwargs = {"k": args.k} if args.algorithm == "kmutex" else {}
+    if args.algorithm == "hier":
+        kwargs["global_group"] = args.global_group
+    runtime = default_runtime() if args.runtime == "async" else None
+    peers = [peer_class(name=name, heartbeat_mode=args.hb_mode, heartbeat_fanout=args.hb_fanout,
+                        heartbeat_silence=args.hb_silence, ns_address=(ns_host, ns_port),
+                        max_hold_time=args.max_hold, reentrant=args.reentrant,
+                        metrics_file=args.metrics_file and _metrics_path(args.metrics_file, name, len(names)),
+                        metrics_interval=args.metrics_interval,
+                        runtime=runtime, serializer=args.serializer, **kwargs)
+             for name in names]
+    tags = (group_tag(args.group),) if args.group else ()
 
-    # cria daemon Pyro em porta especificada
+    # cria daemon Pyro em porta especificada; todos os peers do processo usam o mesmo,
+    # e entre eles as chamadas vão direto ao objeto (local_transport), sem socket
     daemon = Pyro5.api.Daemon(host="localhost", port=port)
-    uri = daemon.register(p)
-    try:
-        # registra no nameserver (se já existir um registro com mesmo nome, sobrescreve)
-        ns.register(name, uri)
-        print(f"[start_peer] Registrado {name} no NameServer com URI {uri}")
-    except Exception as e:
-        print("[start_peer] Erro ao registrar no NameServer:", e)
-        # tenta remover registro antigo e registrar novamente
+    for p in peers:
+        name = p.name
+        uri = local_transport.host(daemon, p)
         try:
-            ns.remove(name)
-            ns.register(name, uri)
-            print(f"[start_peer] Registrado {name} após remover registro antigo.")
-        except Exception as e2:
-            print("[start_peer] Falha ao registrar:", e2)
-            daemon.shutdown()
-            sys.exit(1)
+            # registra no nameserver (se já existir um registro com mesmo nome, sobrescreve)
+            register_peer(ns, name, uri, tags)
+            print(f"[start_peer] Registrado {name} no NameServer com URI {uri}")
+        except Exception as e:
+            print("[start_peer] Erro ao registrar no NameServer:", e)
+            # tenta remover registro antigo e registrar novamente
+            try:
+                ns.remove(name)
+                register_peer(ns, name, uri, tags)
+                print(f"[start_peer] Registrado {name} após remover registro antigo.")
+            except Exception as e2:
+                print("[start_peer] Falha ao registrar:", e2)
+                daemon.shutdown()
+                sys.exit(1)
+
+    # descobre os peers atuais e anuncia a entrada a eles; depois disso as mudanças
+    # chegam por push (membership_update) e o NS só é consultado como fallback lento
+    for p in peers:
+        p.update_peers_from_nameserver(ns, tags)
+        p.announce_join(p.uri)
 
-    # inicia thread para atualizar peers periodicamente consultando nameserver
-    def discovery_loop():
-    	while True:
-        	try:
-            		# cada thread precisa criar seu proxy pro NameServer
-            		local_ns = Pyro5.api.locate_ns(host=ns_host, port=ns_port)
-            		p.update_peers_from_nameserver(local_ns)
-        	except Exception as ex:
-            		print("[discovery_loop] erro:", ex)
-        	time.sleep(1.0)
-        
-    t = threading.Thread(target=discovery_loop, daemon=True)
-    t.start()
+    def on_snapshot(found):
+        for p in peers:
+            p.sync_membership(found)
 
-    print(f"[start_peer] {name} rodando em {uri}. CTRL+C para encerrar.")
+    # uma consulta de fallback serve a todos os peers do processo
+    watcher = MembershipWatcher(on_snapshot, host=ns_host, port=ns_port,
+                                interval=args.discovery_interval, tags=tags, runtime=runtime)
+    watcher.start()
+
+    print(f"[start_peer] {', '.join(names)} rodando em localhost:{port}. CTRL+C para encerrar.")
     try:
         daemon.requestLoop()
     except KeyboardInterrupt:
         print("[start_peer] KeyboardInterrupt, encerrando.")
     finally:
-        try:
-            ns.remove(name)
-            print(f"[start_peer] Removido {name} do nameserver.")
-        except Exception:
-            pass
-        try:
-            p.shutdown()
-        except:
-            pass
+        watcher.stop()
+        for p in peers:
+            try:
+                ns.remove(p.name)
+                print(f"[start_peer] Removido {p.name} do nameserver.")
+            except Exception:
+                pass
+            try:
+                p.shutdown()
+            except:
+                pass
         daemon.shutdown()
 
+def _metrics_path(path, name, count):
+    # com vários peers no processo, cada um grava o seu arquivo: metrics.json -> metrics.P1.json
+    if count == 1:
+        return path
+    root, dot, ext = path.rpartition(".")
+    return f"{root}.{name}.{ext}" if dot else f"{path}.{name}"
+
 if __name__ == "__main__":
     main()
 
@@ -0,0 +1,317 @@
+# suzuki_kasami.py
+# Exclusão mútua baseada em token (Suzuki & Kasami). Quem está com o token entra na SC
+# sem trocar mensagens; os demais difundem REQUEST(n) e esperam o token chegar.
+# O token é regenerado quando o detector de falhas remove o peer que o detinha.
+import threading
+import time
+import Pyro5.api
+import Pyro5.errors
+from event_feed import DEFER
+from peer import DEFAULT_RESOURCE, RELEASED, WANTED, WRITE, Peer, _Resource, _label
+
+# pseudo-peer usado em awaiting: o pedido espera "a resposta do token"
+TOKEN = "<token>"
+
+
+class _TokenResource(_Resource):
+    __slots__ = ("rn", "token", "epoch", "completed")
+
+    def __init__(self, resource_id):
+        super().__init__(resource_id)
+        self.rn = {}
+        self.token = None
+        self.epoch = 0
+        self.completed = 0
+
+    def idle(self):
+        # RN e o token precisam sobreviver entre pedidos
+        return False
+
+
+@Pyro5.api.expose
+@Pyro5.api.behavior(instance_mode="single")
+class TokenPeer(Peer):
+    """
+    Mesmo API do Peer, com um token por recurso. Estado do algoritmo (por recurso):
+      rn     -- maior número de pedido visto de cada peer (RN)
+      token  -- {"epoch", "ln", "queue"} enquanto o token está conosco
+      epoch  -- maior época de token conhecida; tokens de época menor são descartados
+
+    Regeneração: o coordenador (menor nome vivo) sonda todos os peers com sk_probe,
+    que também eleva a época conhecida de cada um. Se ninguém tem o token, ele cria
+    um novo com a época seguinte; um token antigo ainda em trânsito é descartado por
+    quem o receber. A sonda é disparada quando um peer é removido pelo heartbeat,
+    quando um pedido espera o token além do que a fila explica (ver _token_overdue)
+    e no primeiro pedido de um recurso (é assim que cada token nasce).
+    """
+
+    def __init__(self, name, token_timeout=2.0, **kwargs):
+        self.token_timeout = token_timeout
+        self._regenerating = threading.Lock()
+        super().__init__(name, **kwargs)
+
+    # há um só token por recurso: não há leitura compartilhada
+    cs_modes = (WRITE,)
+    wire_methods = Peer.wire_methods + ("sk_request",)
+
+    def _new_resource(self, resource_id):
+        return _TokenResource(resource_id)
+
+    # ----------------------
+    # Ganchos do Peer
+    # ----------------------
+    def _request_targets(self, res):
+        if res.token is not None:
+            # token ocioso em mãos: entra sem nenhuma mensagem
+            return {}
+        return {TOKEN: None}
+
+    def _send_request(self, res, targets, timestamp):
+        with self.cs_lock:
+            n = res.rn[self.name] = res.rn.get(self.name, 0) + 1
+            unknown = res.epoch == 0
+        with self.active_lock:
+            peers = list(self.active_peers)
+        self.log(f"Pedindo token (n={n}) a {peers}", level="request")
+        for nm in peers:
+            self._post(nm, "sk_request", n, res.id)
+        self.timers.schedule(self.token_timeout, self._token_overdue, res, timestamp)
+        if unknown and self._coordinator() == self.name and not self._stop:
+            self._executor.submit(self._maybe_regenerate, [res.id], True)
+
+    def _release_locked(self, res, timestamp):
+        res.completed = res.rn.get(self.name, 0)
+        if res.token is None:
+            # desistência sem token: ele será repassado adiante quando chegar
+            return None
+        res.token["ln"][self.name] = res.completed
+        return self._next_holder_locked(res)
+
+    def _after_release(self, res, handoff):
+        if handoff is not None:
+            self._send_token(res, *handoff)
+
+    def _lease_waiters_locked(self, res):
+        # quem tem pedido pendente segundo RN/LN espera o token depois de nós
+        if res.token is None:
+            return set()
+        ln = res.token["ln"]
+        return {nm for nm, n in res.rn.items() if nm != self.name and n > ln.get(nm, 0)}
+
+    def _on_peer_removed(self, peer_name):
+        # chamado com active_lock: a sonda roda no executor
+        if not self._stop:
+            self._executor.submit(self._maybe_regenerate)
+
+    # ----------------------
+    # Mensagens
+    # ----------------------
+    def sk_request(self, sender, n, resource_id=DEFAULT_RESOURCE):
+        self._mark_alive(sender)
+        self.meter.count_received("sk_request")
+        handoff = None
+        with self.cs_lock:
+            res = self._resource(resource_id)
+            res.rn[sender] = max(res.rn.get(sender, 0), n)
+            if res.token is not None and res.state == RELEASED:
+                handoff = self._next_holder_locked(res)
+            elif res.token is not None:
+                # o token está conosco, em uso ou a caminho da SC: o pedido espera a nossa saída
+                self.feed.record(DEFER, self.clock, resource_id, sender)
+            unknown = res.epoch == 0
+        if handoff is not None:
+            self._executor.submit(self._send_token, res, *handoff)
+        elif unknown and self._coordinator() == self.name:
+            # primeiro pedido do recurso que vemos: talvez o token ainda não exista
+            self._executor.submit(self._maybe_regenerate, [resource_id], True)
+        return True
+
+    def sk_token(self, sender, token, resource_id=DEFAULT_RESOURCE):
+        self._mark_alive(sender)
+        self.meter.count_received("sk_token")
+        with self.cs_lock:
+            res = self._resource(resource_id)
+            if token["epoch"] < res.epoch:
+                self.log(f"Descartando token antigo (época {token['epoch']} < {res.epoch}) de {sender}",
+                         level="error")
+                return True
+            handoff = self._take_token_locked(res, token)
+        self.log(f"Recebeu token de {sender}", level="reply")
+        if handoff is not None:
+            # fora do handler: o remetente não deve ficar esperando a cadeia de repasses
+            self._executor.submit(self._send_token, res, *handoff)
+        return True
+
+    def sk_probe(self, coordinator, epochs):
+        # epochs: {resource_id: nova época}; uma sonda cobre todos os recursos
+        self.meter.count_received("sk_probe")
+        result = {}
+        with self.cs_lock:
+            for rid, epoch in epochs.items():
+                res = self._resource(rid)
+                res.epoch = max(res.epoch, epoch)
+                if res.token is not None:
+                    # o token existe: passa a valer na nova época
+                    res.token["epoch"] = res.epoch
+                result[rid] = {"has_token": res.token is not None,
+                               "rn": res.rn.get(self.name, 0),
+                               "ln": res.completed}
+        return result
+
+    def sk_check_token(self, sender, resource_id=DEFAULT_RESOURCE):
+        self.meter.count_received("sk_check_token")
+        self._executor.submit(self._maybe_regenerate, [resource_id])
+        return True
+
+    # ----------------------
+    # Token
+    # ----------------------
+    def _take_token_locked(self, res, token):
+        # com cs_lock: passamos a deter `token`; retorna (destino, token) se ele deve seguir adiante
+        res.epoch = token["epoch"]
+        res.token = token
+        if res.state == WANTED:
+            self._got_permission_locked(res, TOKEN)
+            return None
+        if res.state == RELEASED:
+            # pedido abandonado antes de o token chegar
+            token["ln"][self.name] = res.completed
+            return self._next_holder_locked(res)
+        return None
+
+    def _next_holder_locked(self, res):
+        # com cs_lock e token em mãos: enfileira pedidos pendentes e escolhe o próximo detentor
+        token = res.token
+        ln, queue = token["ln"], token["queue"]
+        with self.active_lock:
+            alive = set(self.active_peers)
+        for nm, n in res.rn.items():
+            if nm != self.name and nm in alive and nm not in queue and n > ln.get(nm, 0):
+                queue.append(nm)
+        while queue:
+            nxt = queue.pop(0)
+            if nxt in alive:
+                res.token = None
+                return nxt, token
+        return None
+
+    def _send_token(self, res, dest, token):
+        while dest is not None:
+            try:
+                self._call(dest, "sk_token", self.name, token, res.id, timeout=self.send_timeout)
+                self.log(f"Enviou token para {dest}", level="reply")
+                return
+            except Pyro5.errors.TimeoutError as e:
+                # o token pode ter chegado: retomá-lo criaria dois tokens. Se ele se perdeu,
+                # o coordenador o regenera quando alguém reclamar ou `dest` for removido.
+                self.log(f"Timeout enviando token para {dest}: {e}", level="error")
+                return
+            except Exception as e:
+                self.log(f"Falha enviando token para {dest}: {e}", level="error")
+            # não foi entregue: o token continua conosco; o pedido de `dest` é descartado (ele vai pedir de novo)
+            with self.cs_lock:
+                token["ln"][dest] = res.rn.get(dest, 0)
+                handoff = self._take_token_locked(res, token)
+            dest, token = handoff if handoff is not None else (None, None)
+
+    # ----------------------
+    # Regeneração
+    # ----------------------
+    def _coordinator(self):
+        with self.active_lock:
+            return min(set(self.active_peers) | {self.name})
+
+    def _overdue_after(self):
+        # espera que a fila explica: todos os outros peers à nossa frente, cada um com a posse
+        # inteira. Limitada a metade de reply_timeout, para a sonda sair antes de desistirmos
+        with self.active_lock:
+            ahead = len(self.active_peers)
+        return min(self.token_timeout + ahead * self.access_time_limit,
+                   max(self.reply_timeout / 2, self.token_timeout))
+
+    def _token_overdue(self, res, timestamp):
+        with self.cs_lock:
+            if res.state != WANTED or res.timestamp != timestamp or res.token is not None:
+                return
+            waited = time.time() - res.since
+        # continua vigiando: a verificação pode ser ignorada por uma regeneração já em curso
+        self.timers.schedule(self.token_timeout, self._token_overdue, res, timestamp)
+        with self.active_lock:
+            suspected = [nm for nm in self.active_peers if self.detector.is_suspected(nm)]
+        if not suspected and waited < self._overdue_after():
+            # detentor provavelmente vivo e a fila andando: sondar todos os N peers só custaria
+            # mensagens e, elevando as épocas, descartaria o token em trânsito
+            return
+        coordinator = self._coordinator()
+        self.log(f"Token não chegou em {waited:.1f}s (suspeitos: {suspected or '-'}); "
+                 f"pedindo verificação a {coordinator}", level="error")
+        if coordinator == self.name:
+            self._maybe_regenerate([res.id])
+        else:
+            try:
+                self._call(coordinator, "sk_check_token", self.name, res.id,
+                           oneway=True, timeout=self._rto(coordinator))
+            except Exception as e:
+                self.log(f"Falha contatando coordenador {coordinator}: {e}", level="error")
+
+    def _maybe_regenerate(self, resource_ids=None, only_unknown=False):
+        # resource_ids=None: todos os recursos conhecidos (o detentor removido é desconhecido).
+        # only_unknown: só recursos dos quais nunca vimos um token (criação do primeiro)
+        if self._coordinator() != self.name:
+            return
+        if not self._regenerating.acquire(blocking=False):
+            return
+        try:
+            self._regenerate(resource_ids, only_unknown)
+        finally:
+            self._regenerating.release()
+
+    def _regenerate(self, resource_ids, only_unknown=False):
+        epochs = {}
+        with self.cs_lock:
+            if resource_ids is None:
+                resource_ids = list(self.resources)
+            for rid in resource_ids:
+                res = self._resource(rid)
+                if res.token is None and not (only_unknown and res.epoch):
+                    res.epoch += 1
+                    epochs[rid] = res.epoch
+        if not epochs:
+            return
+        with self.active_lock:
+            peers = dict(self.active_peers)
+        results, errors = self._gather(peers, "sk_probe", self.name, epochs, timeout=self.send_timeout)
+        failed = [nm for nm, err in errors.items() if err is not None]
+        if failed:
+            # sem a resposta de todos não dá para garantir que o token sumiu; tenta na próxima remoção/timeout
+            self.log(f"Regeneração adiada, sem resposta de {failed}", level="error")
+            return
+        handoffs = []
+        with self.cs_lock:
+            for rid, epoch in epochs.items():
+                res = self.resources[rid]
+                if res.token is not None or res.epoch != epoch:
+                    continue
+                if any(r[rid]["has_token"] for r in results.values()):
+                    continue
+                for nm, r in results.items():
+                    res.rn[nm] = max(res.rn.get(nm, 0), r[rid]["rn"])
+                ln = {nm: r[rid]["ln"] for nm, r in results.items()}
+                ln[self.name] = res.completed
+                self.log(f"Token{_label(rid)} regenerado (época {epoch}).", level="sc")
+                handoff = self._take_token_locked(res, {"epoch": epoch, "ln": ln, "queue": []})
+                if handoff is not None:
+                    handoffs.append((res, *handoff))
+        for handoff in handoffs:
+            self._send_token(*handoff)
+
+    def info(self):
+        info = super().info()
+        with self.cs_lock:
+            res = self.resources.get(DEFAULT_RESOURCE)
+            info["algorithm"] = "token"
+            info["has_token"] = res is not None and res.token is not None
+            info["token_epoch"] = res.epoch if res else 0
+            info["token_queue"] = list(res.token["queue"]) if res and res.token else []
+            info["tokens_held"] = sorted(rid for rid, r in self.resources.items() if r.token is not None)
+        return info